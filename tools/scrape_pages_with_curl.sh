@@ -33,10 +33,12 @@ write_data() {
 }
 
 PROJECT_ROOT=$(cd $(dirname $0) && git rev-parse --show-toplevel)
-OUT_DIR=$PROJECT_ROOT/waterCrisis/properties/var/unprocessed_html
-
 TODAY=$(date +'%Y-%m-%d')
 
+# Use the directory for the current month, as read by the properties module.
+OUT_DIR=$PROJECT_ROOT/waterCrisis/properties/var/unprocessed_html/$(date +'%Y-%m')
+mkdir -p "$OUT_DIR"
+
 WC_IN='https://www.property24.com/property-values/western-cape/9'
 CT_IN='https://www.property24.com/property-values/cape-town/western-cape/432'
 
@@ -0,0 +1,60 @@
+"""
+Configuration file for the combined module.
+"""
+import os
+
+
+def _get_file_paths():
+    """Build and return configured paths for reading and writing files.
+
+    The outputs of the other modules are read from their var directories.
+    They are not required to exist, since each is ingested when available.
+    The properties var directory is set by PROPERTY24_VAR_DIR, as for the
+    properties module.
+
+    @return: Tuple of paths to the following locations:
+        - cleaned dam levels CSV.
+        - processed property data CSV.
+        - stored News24 water crisis HTML page.
+        - SQLite database of the combined store.
+    """
+    water_crisis_dir = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), os.pardir)
+    )
+    var_dir = os.path.join(water_crisis_dir, 'combined', 'var')
+    assert os.access(var_dir, os.W_OK), \
+        "Unable to write to var directory: {}".format(var_dir)
+
+    dam_csv_path = os.path.join(water_crisis_dir, 'dam_levels', 'var',
+                                "dam_levels_cleaned.csv")
+    # Follow the var directory of the properties module, which can be set
+    # with the same environment variable.
+    property_var_path = os.environ.get('PROPERTY24_VAR_DIR')
+    if property_var_path:
+        property_var_path = os.path.abspath(
+            os.path.expanduser(property_var_path)
+        )
+    else:
+        property_var_path = os.path.join(water_crisis_dir, 'properties',
+                                         'var')
+    property_csv_path = os.path.join(property_var_path, "processed_data.csv")
+    news_html_path = os.path.join(water_crisis_dir, 'news', 'var',
+                                  "news24.html")
+    store_path = os.path.join(var_dir, "combined.sqlite3")
+
+    return dam_csv_path, property_csv_path, news_html_path, store_path
+
+
+### Paths
+
+DAM_CSV_PATH, PROPERTY_CSV_PATH, NEWS_HTML_PATH, STORE_PATH = \
+    _get_file_paths()
+NEWS_DIR = os.path.dirname(os.path.dirname(NEWS_HTML_PATH))
+PROPERTIES_DIR = os.path.join(os.path.dirname(NEWS_DIR), 'properties')
+
+
+### Joins
+
+# Dam or aggregate of dams, as named in the cleaned dam levels CSV, whose
+# fullness and storage are joined to the daily values.
+JOIN_DAM = 'All Dams'
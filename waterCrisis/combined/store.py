@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Combined store application file.
+
+Ingest the outputs of the dam_levels, properties and news modules into a
+single SQLite database, keyed by date as a "YYYY-MM-DD" string, and keep
+precomputed daily joins of them for fast queries across datasets.
+
+Sources are ingested incrementally. For the CSVs, only the bytes appended
+since the last update are read, unless the previously ingested bytes have
+changed, in which case that source is ingested again in full. Rows of the
+dam levels CSV without values are skipped, and trailing rows without values
+are left until they have values.
+The news page is parsed again only if it has been modified, and articles
+are added by URI.
+
+Tables of the store:
+
+    dam_levels: Fullness and storage of each dam, by date.
+    property_values: Average price and property count of each area, by date.
+    news_items: Articles with their published date.
+    daily: For each date with any data, the fullness and storage of the
+        configured join dam and the count of news articles published.
+    daily_area: For each area and date with property values, those values
+        joined with the daily values of the same date.
+
+The daily tables are refreshed from the earliest date changed by an update.
+
+Usage:
+    $ ./store.py update
+    $ ./store.py correlate dam_fullness news_count
+    $ ./store.py correlate avg_price dam_fullness --area cape-town
+    $ ./store.py daily cape-town --parent western-cape --start 2018-05
+"""
+import argparse
+import csv
+import importlib.util
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dam_levels (
+    dam TEXT NOT NULL,
+    date TEXT NOT NULL,
+    fullness REAL,
+    storage REAL,
+    PRIMARY KEY (dam, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS property_values (
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    area_type TEXT NOT NULL,
+    avg_price INTEGER,
+    property_count INTEGER,
+    PRIMARY KEY (parent, name, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS property_values_date ON property_values (date);
+CREATE INDEX IF NOT EXISTS property_values_name ON property_values (name);
+CREATE TABLE IF NOT EXISTS news_items (
+    uri TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    title TEXT
+);
+CREATE INDEX IF NOT EXISTS news_items_date ON news_items (date);
+CREATE TABLE IF NOT EXISTS daily (
+    date TEXT PRIMARY KEY,
+    dam_fullness REAL,
+    dam_storage REAL,
+    news_count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_area (
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    area_type TEXT NOT NULL,
+    avg_price INTEGER,
+    property_count INTEGER,
+    dam_fullness REAL,
+    dam_storage REAL,
+    news_count INTEGER NOT NULL,
+    PRIMARY KEY (parent, name, date)
+) WITHOUT ROWID;
+"""
+DAILY_COLUMNS = ('dam_fullness', 'dam_storage', 'news_count')
+AREA_COLUMNS = ('avg_price', 'property_count')
+DAM_SUFFIXES = (" Fullness (%)", " Storage (Ml)")
+
+
+def _to_float(value):
+    return float(value) if value else None
+
+
+def _to_int(value):
+    return int(value) if value else None
+
+
+def _load_module(module_name, f_path):
+    spec = importlib.util.spec_from_file_location(module_name, f_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def load_news_parser(news_dir=config.NEWS_DIR):
+    """Load and return the parser module of the news module directory."""
+    return _load_module('news_parser',
+                        os.path.join(news_dir, "parser.py"))
+
+
+# Shared with the query index of the properties module, which keeps its
+# sidecar the same way.
+hash_prefix = _load_module(
+    'properties_file_digest',
+    os.path.join(config.PROPERTIES_DIR, "file_digest.py")
+).hash_prefix
+
+
+def pearson(pairs):
+    """Return the Pearson correlation coefficient of (x, y) pairs, or None.
+
+    None is returned if there are fewer than 2 pairs or either series is
+    constant.
+    """
+    n = len(pairs)
+    if n < 2:
+        return None
+
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    cov = var_x = var_y = 0.0
+    for x, y in pairs:
+        dx = x - mean_x
+        dy = y - mean_y
+        cov += dx * dy
+        var_x += dx * dx
+        var_y += dy * dy
+    if not var_x or not var_y:
+        return None
+
+    return cov / math.sqrt(var_x * var_y)
+
+
+class CombinedStore(object):
+    """Date-indexed store of dam levels, property values and news."""
+
+    def __init__(self, db_path=config.STORE_PATH):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _get_source(self, name):
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, digest FROM sources WHERE name = ?",
+            (name,)
+        ).fetchone()
+
+        return row if row else (0, 0, "")
+
+    def _set_source(self, name, size, mtime_ns, digest):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+            (name, size, mtime_ns, digest)
+        )
+
+    def _read_appended(self, name, csv_path, has_values):
+        """Return CSV rows appended since the last ingest of a source.
+
+        @param name: Name of the source.
+        @param csv_path: Path of the CSV file.
+        @param has_values: Function which returns True if a row is complete.
+            Rows which are not are skipped. Reading stops after the last row
+            which is, so that any rows after it are read again on the next
+            update.
+
+        @return: Tuple of (rows, reset), where reset is True if the ingested
+            bytes have changed and all rows are returned.
+        """
+        size, _, digest = self._get_source(name)
+        csv_size = os.path.getsize(csv_path)
+        reset = bool(size) and (
+            csv_size < size or hash_prefix(csv_path, size) != digest
+        )
+        if reset:
+            size = 0
+
+        with open(csv_path, 'rb') as f_in:
+            header = f_in.readline()
+            f_in.seek(max(size, len(header)))
+            new_bytes = f_in.read()
+
+        # Only read complete lines, in case the CSV is being written.
+        text = new_bytes[:new_bytes.rfind(b"\n") + 1].decode()
+        lines = [line + "\n" for line in text.split("\n")[:-1]]
+        fieldnames = next(csv.reader([header.decode()]))
+        rows = []
+        read_count = 0
+        for i, values in enumerate(csv.reader(lines)):
+            row = dict(zip(fieldnames, values))
+            if has_values(row):
+                rows.append(row)
+                read_count = i + 1
+        end = len("".join(lines[:read_count]).encode())
+
+        size = max(size, len(header)) + end
+        self._set_source(name, size, os.stat(csv_path).st_mtime_ns,
+                         hash_prefix(csv_path, size))
+
+        return rows, reset
+
+    def ingest_dam_levels(self, csv_path=config.DAM_CSV_PATH):
+        """Add rows of the cleaned dam levels CSV.
+
+        @return: Tuple of (count of rows added, earliest date changed or
+            "" if all dates changed, or None if nothing changed).
+        """
+        def has_values(row):
+            return any(value for key, value in row.items()
+                       if key != 'Date'
+                       and not key.startswith("Land-en-Zeezicht"))
+
+        rows, reset = self._read_appended('dam_levels', csv_path, has_values)
+        if reset:
+            self.conn.execute("DELETE FROM dam_levels")
+
+        values = []
+        for row in rows:
+            for key in row:
+                if key.endswith(DAM_SUFFIXES[0]):
+                    dam = key[:-len(DAM_SUFFIXES[0])]
+                    values.append((
+                        dam,
+                        row['Date'],
+                        _to_float(row[key]),
+                        _to_float(row[dam + DAM_SUFFIXES[1]])
+                    ))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO dam_levels VALUES (?, ?, ?, ?)", values
+        )
+
+        return len(rows), self._get_since(reset, rows)
+
+    def ingest_properties(self, csv_path=config.PROPERTY_CSV_PATH):
+        """Add rows of the processed property data CSV.
+
+        @return: Tuple as for `ingest_dam_levels`.
+        """
+        rows, reset = self._read_appended('property_values', csv_path,
+                                          lambda row: True)
+        if reset:
+            self.conn.execute("DELETE FROM property_values")
+
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO property_values VALUES (?, ?, ?, ?, ?, ?)",
+            ((row['Parent'], row['Name'], row['Date'], row['Area Type'],
+              _to_int(row['Average Price']), _to_int(row['Property Count']))
+             for row in rows)
+        )
+
+        return len(rows), self._get_since(reset, rows)
+
+    def ingest_news(self, html_path=config.NEWS_HTML_PATH):
+        """Add articles of the stored news page which are not in the store.
+
+        Articles without a published date are left out, since they cannot be
+        joined by date.
+
+        @return: Tuple as for `ingest_dam_levels`.
+        """
+        stat = os.stat(html_path)
+        size, mtime_ns, _ = self._get_source('news_items')
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return 0, None
+
+        with open(html_path) as f_in:
+            news_items = load_news_parser().parse_news(f_in.read())
+        known_uris = {uri for uri, in self.conn.execute(
+            "SELECT uri FROM news_items"
+        )}
+        new_rows = [
+            {'Date': item.publishedAt.isoformat(), 'uri': item.uri,
+             'title': item.title}
+            for item in news_items
+            if item.publishedAt and item.uri not in known_uris
+        ]
+        self.conn.executemany(
+            "INSERT INTO news_items VALUES (?, ?, ?)",
+            ((row['uri'], row['Date'], row['title']) for row in new_rows)
+        )
+        self._set_source('news_items', stat.st_size, stat.st_mtime_ns, "")
+
+        return len(new_rows), self._get_since(False, new_rows)
+
+    def _get_since(self, reset, rows):
+        if reset:
+            return ""
+        if not rows:
+            return None
+
+        return min(row['Date'] for row in rows)
+
+    def refresh_daily(self, since=""):
+        """Compute the daily tables again from a date onwards.
+
+        @param since: First date to compute, as "YYYY-MM-DD". Defaults to
+            all dates.
+        """
+        params = {'since': since, 'dam': config.JOIN_DAM}
+        self.conn.execute("DELETE FROM daily WHERE date >= :since", params)
+        self.conn.execute("""
+            INSERT INTO daily
+            SELECT d.date, dl.fullness, dl.storage, COALESCE(n.news_count, 0)
+            FROM (
+                SELECT date FROM dam_levels
+                WHERE dam = :dam AND date >= :since
+                UNION SELECT date FROM news_items WHERE date >= :since
+                UNION SELECT date FROM property_values WHERE date >= :since
+            ) AS d
+            LEFT JOIN dam_levels AS dl ON dl.dam = :dam AND dl.date = d.date
+            LEFT JOIN (
+                SELECT date, COUNT(*) AS news_count FROM news_items
+                WHERE date >= :since GROUP BY date
+            ) AS n ON n.date = d.date
+        """, params)
+
+        self.conn.execute("DELETE FROM daily_area WHERE date >= :since",
+                          params)
+        self.conn.execute("""
+            INSERT INTO daily_area
+            SELECT p.parent, p.name, p.date, p.area_type, p.avg_price,
+                p.property_count, d.dam_fullness, d.dam_storage, d.news_count
+            FROM property_values AS p
+            JOIN daily AS d ON d.date = p.date
+            WHERE p.date >= :since
+        """, params)
+
+    def update(self):
+        """Ingest any new data of all sources and refresh the daily tables.
+
+        Sources which do not exist yet are skipped.
+
+        @return: dict of source names to counts of rows added.
+        """
+        ingest_functions = (
+            ('dam_levels', self.ingest_dam_levels, config.DAM_CSV_PATH),
+            ('property_values', self.ingest_properties,
+             config.PROPERTY_CSV_PATH),
+            ('news_items', self.ingest_news, config.NEWS_HTML_PATH),
+        )
+        added = {}
+        since_dates = []
+        with self.conn:
+            for name, ingest, f_path in ingest_functions:
+                if not os.path.exists(f_path):
+                    continue
+                added[name], since = ingest(f_path)
+                if since is not None:
+                    since_dates.append(since)
+            if since_dates:
+                self.refresh_daily(min(since_dates))
+
+        return added
+
+    def _get_area_parent(self, name, parent=None):
+        """Return the parent of an area, if it can be found by name alone.
+
+        @throws: KeyError if the area is not found or the name matches areas
+            in more than one parent.
+        """
+        if parent is not None:
+            return parent
+
+        parents = [p for p, in self.conn.execute(
+            "SELECT DISTINCT parent FROM property_values WHERE name = ?",
+            (name,)
+        )]
+        if len(parents) != 1:
+            raise KeyError("Expected one area named {!r} but found parents:"
+                           " {}".format(name, parents))
+
+        return parents[0]
+
+    def get_series(self, columns, name=None, parent=None, start=None,
+                   end=None):
+        """Return joined daily values, for an area or for all dates.
+
+        @param columns: Names of columns to return, from DAILY_COLUMNS, and
+            from AREA_COLUMNS if an area is given.
+        @param name: Optional name of an area.
+        @param parent: Name of the area's parent, if the name is ambiguous.
+        @param start: Optional first date, to any precision.
+        @param end: Optional last date, to any precision.
+
+        @return: List of tuples of (date, *values), sorted by date.
+        @throws: ValueError if a column is not known.
+        """
+        allowed = DAILY_COLUMNS + (AREA_COLUMNS if name else ())
+        for column in columns:
+            if column not in allowed:
+                raise ValueError("Unknown column: {!r}. Expected one of:"
+                                 " {}".format(column, ", ".join(allowed)))
+
+        clauses = []
+        params = []
+        if name:
+            table = 'daily_area'
+            clauses.append("parent = ? AND name = ?")
+            params.extend([self._get_area_parent(name, parent), name])
+        else:
+            table = 'daily'
+        if start:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end:
+            # Include the whole of the end period, at its precision.
+            clauses.append("date <= ?")
+            params.append(end + "~")
+        sql = "SELECT date, {} FROM {}{} ORDER BY date".format(
+            ", ".join(columns),
+            table,
+            " WHERE " + " AND ".join(clauses) if clauses else ""
+        )
+
+        return self.conn.execute(sql, params).fetchall()
+
+    def correlate(self, x, y, name=None, parent=None, start=None, end=None):
+        """Return the correlation of two columns across dates.
+
+        Dates where either value is missing are left out. Arguments are as
+        for `get_series`.
+
+        @return: Tuple of (Pearson correlation coefficient or None, count of
+            dates).
+        """
+        pairs = [
+            (x_value, y_value) for _, x_value, y_value
+            in self.get_series((x, y), name, parent, start, end)
+            if x_value is not None and y_value is not None
+        ]
+
+        return pearson(pairs), len(pairs)
+
+
+def main():
+    """
+    Command-line function to update or query the combined store.
+    """
+    parser = argparse.ArgumentParser(description="Combined store utility."
+                                     " Join dam levels, property values and"
+                                     " news by date.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser(
+        'update',
+        help="Ingest new data from each module and refresh the daily joins."
+    )
+    correlate_parser = subparsers.add_parser(
+        'correlate',
+        help="Print the correlation of two columns across dates."
+    )
+    correlate_parser.add_argument('x', choices=DAILY_COLUMNS + AREA_COLUMNS)
+    correlate_parser.add_argument('y', choices=DAILY_COLUMNS + AREA_COLUMNS)
+    correlate_parser.add_argument('--area', help="Name of an area, required"
+                                  " for property columns.")
+    daily_parser = subparsers.add_parser(
+        'daily',
+        help="Print the joined daily values of an area."
+    )
+    daily_parser.add_argument('area')
+    for sub in (correlate_parser, daily_parser):
+        sub.add_argument('--parent')
+        sub.add_argument('--start', metavar="YYYY[-MM[-DD]]")
+        sub.add_argument('--end', metavar="YYYY[-MM[-DD]]")
+    args = parser.parse_args()
+
+    store = CombinedStore()
+    start = time.time()
+    try:
+        if args.command == 'update':
+            added = store.update()
+            for name, count in sorted(added.items()):
+                print("Added {}: {:,d}".format(name, count))
+            print("Duration: {:,.2f}s".format(time.time() - start))
+        elif args.command == 'correlate':
+            try:
+                coefficient, count = store.correlate(
+                    args.x, args.y, args.area, args.parent, args.start,
+                    args.end
+                )
+            except (KeyError, ValueError) as e:
+                sys.exit(e)
+            print("Correlation of {} and {}: {} over {:,d} dates".format(
+                args.x,
+                args.y,
+                "{:.3f}".format(coefficient) if coefficient is not None
+                else "-",
+                count
+            ))
+            print("Duration: {:,.1f}ms".format((time.time() - start) * 1000))
+        else:
+            columns = AREA_COLUMNS + DAILY_COLUMNS
+            try:
+                rows = store.get_series(columns, args.area, args.parent,
+                                        args.start, args.end)
+            except KeyError as e:
+                sys.exit(e)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(('date',) + columns)
+            writer.writerows(rows)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
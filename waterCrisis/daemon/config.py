@@ -0,0 +1,49 @@
+"""
+Configuration file for the daemon module.
+"""
+import os
+
+
+def _get_module_dirs():
+    """Build and return paths to the module directories which have jobs.
+
+    @return: Tuple of paths to the dam_levels, properties, news and
+        combined module directories.
+    """
+    water_crisis_dir = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), os.pardir)
+    )
+    dam_levels_dir = os.path.join(water_crisis_dir, 'dam_levels')
+    properties_dir = os.path.join(water_crisis_dir, 'properties')
+    news_dir = os.path.join(water_crisis_dir, 'news')
+    combined_dir = os.path.join(water_crisis_dir, 'combined')
+
+    return dam_levels_dir, properties_dir, news_dir, combined_dir
+
+
+### Paths
+
+DAM_LEVELS_DIR, PROPERTIES_DIR, NEWS_DIR, COMBINED_DIR = _get_module_dirs()
+NEWS_HTML_PATH = os.path.join(NEWS_DIR, 'var', 'news24.html')
+
+
+### Scheduling
+
+# Number of seconds between the start of one run of a job and the next.
+# Each job is scheduled independently of the others.
+JOB_INTERVALS = {
+    'dam_levels': 24 * 60 * 60,
+    'properties': 6 * 60 * 60,
+    'news': 12 * 60 * 60,
+    'combined': 6 * 60 * 60,
+}
+# Maximum number of seconds to sleep in one go while waiting for the next
+# job to be due, so that a stop request is noticed promptly.
+POLL_INTERVAL = 1.0
+
+
+### Status endpoint
+
+# The status endpoint is only bound to the local interface.
+STATUS_HOST = '127.0.0.1'
+STATUS_PORT = 8026
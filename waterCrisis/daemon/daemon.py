@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Daemon application file.
+
+Run the dam levels, properties, news and combined store jobs within a single
+long-running process, each on its own configured interval. This is an
+alternative to starting each script cold from cron, as connections and
+parsed metadata are kept in memory between runs.
+
+A status endpoint is served on the local interface, which returns JSON
+with the last run timings of each job and the count of jobs which are due
+but waiting to run.
+
+    $ curl http://127.0.0.1:8026/status
+"""
+import argparse
+import http.server
+import json
+import threading
+
+import config
+from jobs import get_jobs
+from scheduler import Scheduler
+
+
+def make_status_server(scheduler, host, port):
+    """Create and return an HTTP server for the scheduler's status.
+
+    @param scheduler: Scheduler object to report on.
+    @param host: Interface to bind to.
+    @param port: Port to bind to. Use 0 to pick any free port.
+
+    @return: http.server.ThreadingHTTPServer object, not yet serving.
+    """
+    class StatusHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("", "/status"):
+                body = json.dumps(scheduler.status(), indent=2).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', "application/json")
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            # Keep the output for job progress only.
+            pass
+
+    return http.server.ThreadingHTTPServer((host, port), StatusHandler)
+
+
+def main():
+    """
+    Command-line function to schedule the jobs and serve the status.
+    """
+    parser = argparse.ArgumentParser(description="Daemon utility. Run the"
+                                     " scrape and process jobs on intervals"
+                                     " within one process.")
+    parser.add_argument(
+        '-j', '--jobs',
+        nargs='+',
+        choices=sorted(config.JOB_INTERVALS.keys()),
+        default=sorted(config.JOB_INTERVALS.keys()),
+        help="Optionally choose which jobs to run. Defaults to all."
+    )
+    parser.add_argument(
+        '-p', '--port',
+        type=int,
+        default=config.STATUS_PORT,
+        help="Port for the status endpoint. Default: {}".format(
+            config.STATUS_PORT
+        )
+    )
+    args = parser.parse_args()
+
+    scheduler = Scheduler(poll_interval=config.POLL_INTERVAL)
+    job_funcs = get_jobs()
+    for name in args.jobs:
+        scheduler.add_job(name, job_funcs[name], config.JOB_INTERVALS[name])
+
+    server = make_status_server(scheduler, config.STATUS_HOST, args.port)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    print("Serving status on: http://{}:{}/status".format(
+        *server.server_address
+    ))
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        print("\nStopping")
+    finally:
+        scheduler.stop()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
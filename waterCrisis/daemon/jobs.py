@@ -0,0 +1,133 @@
+"""
+Daemon jobs.
+
+Wrap the application scripts of the dam_levels, properties, news and
+combined modules as jobs which keep their state warm between runs. The
+scripts in each of those modules import a sibling `config` module by name,
+so each script is loaded with its own directory on the path and its own
+`config` module.
+"""
+import importlib.util
+import os
+import sys
+
+import requests
+
+import config
+
+
+def load_module(module_dir, script_name):
+    """Load a script from a module directory and return it.
+
+    The loaded module is registered under a name prefixed with the
+    directory name, to avoid a clash between modules of the same name in
+    different directories. Any `config` module imported while loading
+    is bound within the loaded module only and then removed from the
+    shared modules cache, so that the next module can load its own.
+
+    @param module_dir: Path to the directory containing the script.
+    @param script_name: Name of the script, without the extension.
+
+    @return: The loaded module object.
+    """
+    module_name = "{}_{}".format(os.path.basename(module_dir), script_name)
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    f_path = os.path.join(module_dir, "{}.py".format(script_name))
+    spec = importlib.util.spec_from_file_location(module_name, f_path)
+    module = importlib.util.module_from_spec(spec)
+
+    shared_config = sys.modules.pop('config', None)
+    sys.path.insert(0, module_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(module_dir)
+        sys.modules.pop('config', None)
+        if shared_config is not None:
+            sys.modules['config'] = shared_config
+
+    sys.modules[module_name] = module
+
+    return module
+
+
+class DamLevelsJob(object):
+    """Clean the dam levels CSV, only processing rows added since last run.
+
+    The module is loaded on first run rather than on start up, since its
+    config requires the input CSV to exist.
+    """
+
+    def __call__(self):
+        csv_parser = load_module(config.DAM_LEVELS_DIR, 'csv_parser')
+        csv_parser.append_csv()
+
+
+class PropertiesJob(object):
+    """Scrape the property pages for today then process all HTML to a CSV.
+
+    A single session and the transport using it are kept open across runs,
+    so that connections to the domain are reused. The metadata rows are kept
+    in memory and only read again if the metadata CSV is modified.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.transport = None
+        self.metadata_rows = None
+        self.metadata_mtime = None
+
+    def get_metadata_rows(self, scrape_html):
+        """Return metadata rows, reading the CSV again only if modified."""
+        mtime = os.path.getmtime(scrape_html.config.METADATA_CSV_PATH)
+        if mtime != self.metadata_mtime:
+            self.metadata_rows = scrape_html.read_metadata()
+            self.metadata_mtime = mtime
+
+        return self.metadata_rows
+
+    def __call__(self):
+        scrape_html = load_module(config.PROPERTIES_DIR, 'scrape_html')
+        process_html = load_module(config.PROPERTIES_DIR, 'process_html')
+
+        if self.transport is None:
+            self.transport = scrape_html.get_transport(session=self.session)
+
+        scrape_html.main(
+            session=self.session,
+            metadata_rows=self.get_metadata_rows(scrape_html),
+            transport=self.transport
+        )
+        process_html.html_to_csv(process_html.config.HTML_OUT_DIR)
+
+
+class NewsJob(object):
+    """Parse the stored News24 water crisis page."""
+
+    def __call__(self):
+        news_parser = load_module(config.NEWS_DIR, 'parser')
+        news_parser.main(config.NEWS_HTML_PATH)
+
+
+class CombinedJob(object):
+    """Ingest new outputs of the other modules into the combined store."""
+
+    def __call__(self):
+        store = load_module(config.COMBINED_DIR, 'store')
+        combined_store = store.CombinedStore()
+        try:
+            print(combined_store.update())
+        finally:
+            combined_store.close()
+
+
+def get_jobs():
+    """Return a dict of job names and the job functions to schedule."""
+    return {
+        'dam_levels': DamLevelsJob(),
+        'properties': PropertiesJob(),
+        'news': NewsJob(),
+        'combined': CombinedJob(),
+    }
@@ -0,0 +1,183 @@
+"""
+In-process scheduler.
+
+Run named jobs on independent intervals within a single long-running
+process. The clock and sleep functions are injectable, so that the
+scheduler can be driven by a fake clock instead of waiting in real time.
+"""
+import threading
+import time
+import traceback
+
+
+class Job(object):
+    """Models a named job which is run on a fixed interval."""
+
+    def __init__(self, name, func, interval, next_due):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_due = next_due
+
+        self.run_count = 0
+        self.error_count = 0
+        self.last_start = None
+        self.last_duration = None
+        self.last_error = None
+
+    def __repr__(self):
+        return "<Job(name={name!r}, interval={interval},"\
+            " next_due={next_due})>".format(
+                name=self.name,
+                interval=self.interval,
+                next_due=self.next_due
+            )
+
+
+class Scheduler(object):
+    """Run jobs serially in the order that they become due.
+
+    Jobs are run one at a time, so a slow job delays any others which become
+    due while it is running. The count of those waiting jobs is reported
+    as the queue depth.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep,
+                 poll_interval=1.0):
+        """
+        @param clock: Function which returns the current time in seconds.
+        @param sleep: Function which takes a number of seconds to wait.
+        @param poll_interval: Maximum number of seconds to sleep in one go,
+            so that a call to `stop` is noticed.
+        """
+        self.clock = clock
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+
+        self.jobs = []
+        self.running = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def add_job(self, name, func, interval, delay=0):
+        """Add a job to the schedule and return it.
+
+        @param name: Unique name of the job, used on the status output.
+        @param func: Function to call without arguments when the job is due.
+        @param interval: Number of seconds between the start of one run
+            and the next.
+        @param delay: Number of seconds to wait before the first run.
+            Defaults to running on the first check.
+
+        @return: The new Job object.
+        """
+        assert name not in [job.name for job in self.jobs], \
+            "Job name already scheduled: {}".format(name)
+
+        job = Job(name, func, interval, next_due=self.clock() + delay)
+        with self._lock:
+            self.jobs.append(job)
+
+        return job
+
+    def due_jobs(self):
+        """Return list of jobs which are due now, most overdue first."""
+        now = self.clock()
+        with self._lock:
+            due = [job for job in self.jobs if job.next_due <= now]
+
+        return sorted(due, key=lambda job: job.next_due)
+
+    def run_job(self, job):
+        """Run a single job and record its timing and outcome.
+
+        An error in a job is recorded and printed, but not raised, so that
+        one failing job does not stop the others from running.
+        """
+        start = self.clock()
+        with self._lock:
+            self.running = job.name
+            job.last_start = start
+            job.next_due = start + job.interval
+
+        error = None
+        try:
+            job.func()
+        except Exception as e:
+            print("Error in job: {}".format(job.name))
+            traceback.print_exc()
+            error = "{}: {}".format(type(e).__name__, e)
+
+        with self._lock:
+            self.running = None
+            job.run_count += 1
+            job.last_duration = self.clock() - start
+            job.last_error = error
+            if error:
+                job.error_count += 1
+
+    def run_pending(self):
+        """Run all jobs which are due now and return the count run."""
+        due = self.due_jobs()
+        for job in due:
+            self.run_job(job)
+
+        return len(due)
+
+    def seconds_until_due(self):
+        """Return seconds until the next job is due, or None if no jobs."""
+        with self._lock:
+            if not self.jobs:
+                return None
+            next_due = min(job.next_due for job in self.jobs)
+
+        return max(next_due - self.clock(), 0)
+
+    def run_forever(self):
+        """Run jobs as they become due, until `stop` is called."""
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            self.run_pending()
+
+            wait = self.seconds_until_due()
+            if wait is None:
+                wait = self.poll_interval
+            self.sleep(min(wait, self.poll_interval))
+
+    def stop(self):
+        """Request that `run_forever` returns after the current job."""
+        self._stopped.set()
+
+    def status(self):
+        """Return a dict of the current state of the scheduler and its jobs.
+
+        Times are given as seconds relative to now, according to the
+        scheduler's clock.
+        """
+        now = self.clock()
+        with self._lock:
+            jobs = []
+            for job in self.jobs:
+                jobs.append({
+                    'name': job.name,
+                    'interval': job.interval,
+                    'run_count': job.run_count,
+                    'error_count': job.error_count,
+                    'seconds_since_last_start': (
+                        now - job.last_start if job.last_start is not None
+                        else None
+                    ),
+                    'last_duration': job.last_duration,
+                    'last_error': job.last_error,
+                    'seconds_until_due': max(job.next_due - now, 0),
+                })
+            queue_depth = len([
+                job for job in self.jobs
+                if job.next_due <= now and job.name != self.running
+            ])
+
+            return {
+                'running': self.running,
+                'queue_depth': queue_depth,
+                'jobs': jobs,
+            }
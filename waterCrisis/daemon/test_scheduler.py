@@ -0,0 +1,256 @@
+"""
+Tests for the scheduler and status endpoint, driven by a fake clock, and for
+the properties job, run against a local replay server.
+
+Usage:
+    $ python -m unittest test_scheduler
+"""
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import unittest.mock
+import urllib.request
+
+import config
+from daemon import make_status_server
+from jobs import PropertiesJob, load_module
+from scheduler import Scheduler
+
+
+class FakeClock(object):
+    """Clock which only moves forward when slept on or advanced."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+        self.calls = []
+
+    def add_job(self, name, interval, delay=0, func=None):
+        def default_func():
+            self.calls.append((name, self.clock.now))
+
+        return self.scheduler.add_job(name, func or default_func, interval,
+                                      delay)
+
+    def test_jobs_run_on_their_intervals(self):
+        self.add_job('fast', 10)
+        self.add_job('slow', 25, delay=5)
+
+        for _ in range(31):
+            self.scheduler.run_pending()
+            self.clock.sleep(1)
+
+        self.assertEqual(self.calls, [
+            ('fast', 0), ('slow', 5), ('fast', 10), ('fast', 20),
+            ('fast', 30), ('slow', 30),
+        ])
+
+    def test_slow_job_delays_others(self):
+        def slow_func():
+            self.calls.append(('slow', self.clock.now))
+            self.clock.sleep(15)
+
+        self.add_job('slow', 100, func=slow_func)
+        self.add_job('fast', 10, delay=1)
+
+        self.scheduler.run_pending()
+        self.assertEqual(self.scheduler.status()['queue_depth'], 1)
+        self.scheduler.run_pending()
+
+        self.assertEqual(self.calls, [('slow', 0), ('fast', 15)])
+        self.assertEqual(self.scheduler.status()['queue_depth'], 0)
+
+    def test_error_is_recorded(self):
+        def failing_func():
+            raise ValueError("bad page")
+
+        job = self.add_job('failing', 10, func=failing_func)
+        with unittest.mock.patch('traceback.print_exc'), \
+                unittest.mock.patch('builtins.print'):
+            self.scheduler.run_pending()
+
+        self.assertEqual(job.run_count, 1)
+        self.assertEqual(job.error_count, 1)
+        self.assertEqual(job.last_error, "ValueError: bad page")
+        self.assertEqual(job.next_due, 10)
+
+    def test_run_forever_stops(self):
+        self.add_job('fast', 10)
+
+        def stop_after(seconds):
+            self.clock.sleep(seconds)
+            if self.clock.now >= 35:
+                self.scheduler.stop()
+
+        self.scheduler.sleep = stop_after
+        self.scheduler.run_forever()
+
+        self.assertEqual([now for _, now in self.calls], [0, 10, 20, 30])
+
+    def test_status_endpoint(self):
+        self.add_job('fast', 10)
+        self.add_job('slow', 60, delay=30)
+        self.scheduler.run_pending()
+        self.clock.sleep(4)
+
+        server = make_status_server(self.scheduler, '127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{}/status".format(server.server_port)
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(response.headers['Content-Type'],
+                                 "application/json")
+                status = json.loads(response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertIsNone(status['running'])
+        self.assertEqual(status['queue_depth'], 0)
+        jobs = {job['name']: job for job in status['jobs']}
+        self.assertEqual(jobs['fast']['run_count'], 1)
+        self.assertEqual(jobs['fast']['seconds_since_last_start'], 4)
+        self.assertEqual(jobs['fast']['seconds_until_due'], 6)
+        self.assertEqual(jobs['slow']['run_count'], 0)
+        self.assertIsNone(jobs['slow']['seconds_since_last_start'])
+        self.assertEqual(jobs['slow']['seconds_until_due'], 26)
+
+
+class TestPropertiesJob(unittest.TestCase):
+    """Run the properties job against the sample pages of a replay server.
+
+    The properties config is read when its scripts are loaded, so the host
+    domain and var directory are set before loading and the loaded modules
+    are removed again afterwards.
+    """
+
+    METADATA_ROWS = [
+        {
+            'area_id': 9,
+            'area_type': 'province',
+            'parent_name': 'south-africa',
+            'name': 'western-cape',
+            'path': "/property-values/western-cape/9",
+        },
+        {
+            'area_id': 432,
+            'area_type': 'suburb',
+            'parent_name': 'western-cape',
+            'name': 'cape-town',
+            'path': "/property-values/cape-town/western-cape/432",
+        },
+        {
+            'area_id': 999,
+            'area_type': 'suburb',
+            'parent_name': 'western-cape',
+            'name': 'missing-town',
+            'path': "/property-values/missing-town/western-cape/999",
+        },
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.var_dir = self.tmp_dir.name
+        self.loaded_names = set(sys.modules)
+
+        env = {'PROPERTY24_VAR_DIR': self.var_dir}
+        env_patch = unittest.mock.patch.dict(os.environ, env)
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
+        replay_server = load_module(config.PROPERTIES_DIR, 'replay_server')
+        replay = replay_server.Replay(replay_server.load_pages())
+        self.server = replay_server.ReplayServer(('127.0.0.1', 0), replay)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.host = "http://127.0.0.1:{}".format(self.server.server_port)
+        os.environ['PROPERTY24_HOST_DOMAIN'] = self.host
+
+        # Loaded again with the host domain set.
+        self.unload_properties()
+
+        with open(os.path.join(self.var_dir, "metadata.csv"), 'w') as f_out:
+            writer = csv.DictWriter(f_out, fieldnames=[
+                'area_id', 'area_type', 'parent_name', 'name', 'uri'
+            ])
+            writer.writeheader()
+            for row in self.METADATA_ROWS:
+                row = dict(row)
+                row['uri'] = self.host + row.pop('path')
+                writer.writerow(row)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.unload_properties()
+        self.tmp_dir.cleanup()
+
+    def unload_properties(self):
+        """Remove the properties scripts and their sibling modules, which
+        bind the config they were loaded with."""
+        for name in set(sys.modules) - self.loaded_names:
+            f_path = getattr(sys.modules[name], '__file__', None) or ""
+            if os.path.dirname(f_path) == config.PROPERTIES_DIR:
+                del sys.modules[name]
+
+    def test_job_writes_pages_and_csv(self):
+        job = PropertiesJob()
+        scheduler = Scheduler(clock=FakeClock(), sleep=lambda seconds: None)
+        scheduler.add_job('properties', job, 60)
+        try:
+            with unittest.mock.patch('builtins.print'):
+                scheduler.run_pending()
+        finally:
+            job.session.close()
+            if job.transport is not None:
+                job.transport.close()
+
+        status = scheduler.status()['jobs'][0]
+        self.assertEqual(status['name'], 'properties')
+        self.assertEqual(status['run_count'], 1)
+        self.assertEqual(status['error_count'], 0)
+        self.assertIsNone(status['last_error'])
+
+        html_dir = os.path.join(self.var_dir, "unprocessed_html")
+        html_names = sorted(
+            filename
+            for _, _, filenames in os.walk(html_dir)
+            for filename in filenames
+            if filename.endswith(".html")
+        )
+        self.assertEqual([name.rsplit("|", 1)[0] for name in html_names], [
+            "province|south-africa|western-cape|9",
+            "suburb|western-cape|cape-town|432",
+        ])
+
+        csv_path = os.path.join(self.var_dir, "processed_data.csv")
+        with open(csv_path) as f_in:
+            rows = list(csv.DictReader(f_in))
+        self.assertEqual(
+            sorted((row['Parent'], row['Name']) for row in rows),
+            [('south-africa', 'western-cape'),
+             ('western-cape', 'cape-town')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
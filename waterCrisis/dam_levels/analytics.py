@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Dam level analytics application file.
+
+Compute daily consumption, rolling deltas, year-on-year comparisons and
+projected days to threshold for each dam and aggregate group in
+`config.CAPACITY`, using the cleaned dam levels CSV as input.
+
+Results are cached as a pickled DataFrame. On each update, only rows with
+new dates are computed, using a lookback window of the cached storage
+values. If the storage values of any cached date have changed in the input,
+then the whole history is computed again.
+
+Output columns for each dam, where {DAM} is a key of `config.CAPACITY`:
+    {DAM} Storage (Ml): Storage value as in the input.
+    {DAM} Daily Change (Ml): Change in storage since the previous day.
+    {DAM} 7 Day Delta (Ml): Change in storage since 7 days ago.
+    {DAM} 30 Day Delta (Ml): Change in storage since 30 days ago.
+    {DAM} Consumption Rate (Ml/day): Average daily drop in storage over
+        the projection window. Negative if the dam is filling up.
+    {DAM} Year On Year (%): Change in fullness since the same day a year ago.
+    {DAM} Days To Threshold: Projected days until the dam reaches the
+        threshold fullness at the current consumption rate. Empty if the dam
+        is not being drawn down, or zero if already below the threshold.
+"""
+import os
+
+import pandas
+
+import config
+
+
+# Number of days of cached history which are needed to compute the values
+# of a new day.
+LOOKBACK_DAYS = 366 + max(30, config.PROJECTION_WINDOW)
+
+
+def get_last_date(storage):
+    """Return the last date which has storage values, or None if none do.
+
+    A row counts as empty if all of its storage values are empty or zero,
+    since the CSV parser fills in a zero for Land-en-Zeezicht on rows where
+    the source has no value.
+
+    @param storage: DataFrame of storage columns with a DatetimeIndex.
+    """
+    has_values = storage.fillna(0).ne(0).any(axis=1)
+    if not has_values.any():
+        return None
+
+    return has_values[has_values].index[-1]
+
+
+def read_storage():
+    """Read the cleaned CSV and return a DataFrame of storage values.
+
+    @return: DataFrame with a daily DatetimeIndex and a float column of
+        storage values for each dam. Missing days are added as empty values,
+        so that shifts by a number of rows are shifts by a number of days.
+        Trailing days without any storage values are left out.
+    """
+    storage_columns = ["{} Storage (Ml)".format(dam_name) for dam_name
+                       in config.CAPACITY]
+    df = pandas.read_csv(
+        config.CSV_OUT_PATH,
+        usecols=['Date'] + storage_columns,
+        index_col='Date',
+        parse_dates=['Date']
+    )
+    df = df.sort_index()
+    assert not df.index.has_duplicates, "Duplicate dates in: {}".format(
+        config.CSV_OUT_PATH
+    )
+
+    df = df.asfreq('D').astype(float)
+
+    # The cleaned CSV has empty rows up to today for days which are not
+    # published yet. Caching these would make the cache differ from the
+    # input as soon as the next day is published.
+    last_date = get_last_date(df)
+    if last_date is None:
+        return df.iloc[:0]
+
+    return df.loc[:last_date]
+
+
+def compute_analytics(storage):
+    """Compute analytics for each row of storage values.
+
+    @param storage: DataFrame as returned by `read_storage`.
+
+    @return: DataFrame with the same index and the columns as set out in
+        the module docstring.
+    """
+    columns = {}
+    for dam_name, capacity in config.CAPACITY.items():
+        values = storage["{} Storage (Ml)".format(dam_name)]
+
+        daily_change = values.diff()
+        consumption_rate = -daily_change.rolling(
+            config.PROJECTION_WINDOW,
+            min_periods=config.PROJECTION_WINDOW // 4
+        ).mean()
+        fullness = values / capacity
+        days_to_threshold = (
+            (values - config.THRESHOLD_FULLNESS * capacity)
+            / consumption_rate.where(consumption_rate > 0)
+        ).clip(lower=0)
+
+        columns["{} Storage (Ml)".format(dam_name)] = values
+        columns["{} Daily Change (Ml)".format(dam_name)] = daily_change
+        columns["{} 7 Day Delta (Ml)".format(dam_name)] = values.diff(7)
+        columns["{} 30 Day Delta (Ml)".format(dam_name)] = values.diff(30)
+        columns["{} Consumption Rate (Ml/day)".format(dam_name)] = \
+            consumption_rate
+        columns["{} Year On Year (%)".format(dam_name)] = fullness.diff(365)
+        columns["{} Days To Threshold".format(dam_name)] = days_to_threshold
+
+    return pandas.DataFrame(columns, index=storage.index)
+
+
+def update_analytics():
+    """Update the cached analytics with any new input rows and return them.
+
+    @return: DataFrame of analytics for all dates, as in `compute_analytics`.
+    """
+    storage = read_storage()
+
+    cached = None
+    if os.path.exists(config.ANALYTICS_CACHE_PATH):
+        cached = pandas.read_pickle(config.ANALYTICS_CACHE_PATH)
+        if cached.empty:
+            cached = None
+
+    if cached is not None:
+        cached_storage = cached[storage.columns]
+        overlap = storage.loc[:cached.index[-1]]
+
+        if not (overlap.index.equals(cached_storage.index)
+                and overlap.equals(cached_storage)):
+            print("Cached storage values have changed, computing all")
+            cached = None
+
+    if cached is None:
+        analytics = compute_analytics(storage)
+        print("Computed rows: {:,d}".format(len(analytics)))
+    else:
+        new_storage = storage.loc[storage.index > cached.index[-1]]
+        if new_storage.empty:
+            return cached
+
+        window = pandas.concat([
+            cached_storage.iloc[-LOOKBACK_DAYS:], new_storage
+        ])
+        new_analytics = compute_analytics(window).loc[new_storage.index]
+        analytics = pandas.concat([cached, new_analytics])
+        print("Computed rows: {:,d}".format(len(new_analytics)))
+
+    analytics.to_pickle(config.ANALYTICS_CACHE_PATH)
+
+    return analytics
+
+
+def main():
+    """
+    Update the analytics and print the latest values for the aggregates.
+    """
+    analytics = update_analytics()
+    storage_columns = ["{} Storage (Ml)".format(dam_name) for dam_name
+                       in config.CAPACITY]
+    latest_date = get_last_date(analytics[storage_columns])
+    if latest_date is None:
+        print("No storage values")
+        return
+    latest = analytics.loc[latest_date]
+
+    print("Latest date: {}".format(latest_date.date()))
+    for dam_name in ('All Dams', 'Big Six Dams', 'Small Dams'):
+        print(dam_name)
+        for metric in ('Storage (Ml)', '7 Day Delta (Ml)',
+                       '30 Day Delta (Ml)', 'Consumption Rate (Ml/day)',
+                       'Year On Year (%)', 'Days To Threshold'):
+            print("  {:26} {:>12,.2f}".format(
+                metric,
+                latest["{} {}".format(dam_name, metric)]
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark the dam CSV date parser.
+
+Compare the date parser in `date_parser` against a reference implementation
+of the original logic, on synthetic cell values covering several decades of
+daily dates plus the known quirks of the data. Exits with an error if any
+parsed value differs from the reference. No input CSV is needed.
+
+Usage:
+    $ ./benchmark_parsers.py
+    $ ./benchmark_parsers.py --years 60 --repeat 5
+"""
+import argparse
+import datetime
+import random
+import timeit
+
+import date_parser
+
+
+def reference_parse_date(value):
+    """Original date parsing logic of `extract_storage_values`."""
+    try:
+        date = datetime.datetime.strptime(value, "%d-%b-%y").date()
+    except ValueError:
+        date = datetime.datetime.strptime(value, "%d/%m/%Y").date()
+        date = date.replace(month=5, year=2017)
+
+    return date
+
+
+def make_date_values(years):
+    """Return list of date cell values, one for each day over the years.
+
+    Includes the May 2017 rows in the slash format with inconsistent years
+    and one row with the month as August, as found in the source data.
+    """
+    start = datetime.date(1970, 1, 1)
+    values = []
+    for i in range(years * 365):
+        date = start + datetime.timedelta(days=i)
+        if date.year == 2017 and date.month == 5:
+            month = 8 if date.day == 15 else 5
+            values.append("{:02d}/{:02d}/{}".format(
+                date.day, month, random.choice((2016, 2017, 2018))
+            ))
+        else:
+            values.append(date.strftime("%d-%b-%y"))
+
+    return values
+
+
+def check_identical(name, func, reference_func, values):
+    """Assert that both functions give the same output for all values."""
+    for value in values:
+        expected = reference_func(value)
+        actual = func(value)
+        assert actual == expected, "{} mismatch on {!r}: {!r} != {!r}".format(
+            name, value, actual, expected
+        )
+    print("{}: identical results for {:,d} values".format(name, len(values)))
+
+
+def time_func(func, values, repeat, setup=None):
+    """Return best seconds taken to call func on every value."""
+    def run():
+        if setup:
+            setup()
+        for value in values:
+            func(value)
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def report(name, reference_seconds, seconds, count):
+    print("  {:24} {:8.3f}s {:10,.0f} values/s {:6.1f}x".format(
+        name, seconds, count / seconds, reference_seconds / seconds
+    ))
+
+
+def main():
+    """
+    Command-line function to check and time the date parser.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the dam CSV date"
+                                     " parser against the original logic.")
+    parser.add_argument('--years', type=int, default=60,
+                        help="Years of daily dates to generate.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Times to repeat each timing, keeping the best.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    date_values = make_date_values(args.years)
+
+    check_identical("parse_date", date_parser.parse_date,
+                    reference_parse_date, date_values)
+
+    print("Dates: {:,d}".format(len(date_values)))
+    reference_seconds = time_func(reference_parse_date, date_values,
+                                  args.repeat)
+    report("strptime", reference_seconds, reference_seconds,
+           len(date_values))
+    report("parse_date (cold)", reference_seconds, time_func(
+        date_parser.parse_date, date_values, args.repeat,
+        setup=date_parser.parse_date.cache_clear
+    ), len(date_values))
+    report("parse_date (memoised)", reference_seconds, time_func(
+        date_parser.parse_date, date_values, args.repeat
+    ), len(date_values))
+
+
+if __name__ == '__main__':
+    main()
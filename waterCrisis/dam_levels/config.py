@@ -90,3 +90,23 @@ CSV_IN_PATH, CSV_OUT_PATH = _get_csv_details(
     csv_in_filename="Dam levels update 2012-2018.csv",
     csv_out_filename="dam_levels_cleaned.csv"
 )
+
+# Pattern for finding all input CSV exports, including the configured input
+# and any additional yearly exports in the same format. Where exports overlap,
+# those later in sorted order of filename take precedence.
+CSV_IN_PATTERN = os.path.join(os.path.dirname(CSV_IN_PATH), "Dam levels*.csv")
+# Fingerprint of the input lines processed by the last run, for the
+# incremental mode of the CSV parser.
+STATE_PATH = os.path.join(
+    os.path.dirname(CSV_OUT_PATH), "dam_levels_state.json"
+)
+# Cache of computed analytics, as a pickled DataFrame.
+ANALYTICS_CACHE_PATH = os.path.join(
+    os.path.dirname(CSV_OUT_PATH), "dam_analytics.pkl"
+)
+# Fullness level as a fraction of capacity at which to project the day that
+# a dam reaches. "Day Zero" was defined as the day on which all dams together
+# reach 13.5%.
+THRESHOLD_FULLNESS = 0.135
+# Number of days of consumption to average when projecting days to threshold.
+PROJECTION_WINDOW = 30
@@ -4,11 +4,27 @@ Parse a dam CSV.
 
 Read in a CSV of data around dam levels, clean the data and convert it
 to a dictionary. This is written out to a CSV if running as the main script.
+
+The configured export is read together with any newer exports which match
+the configured pattern, as described in the ingest module, and the rows of
+all of them are merged by date.
 """
+import argparse
+import collections
+import concurrent.futures
 import csv
 import datetime
+import glob
+import hashlib
+import json
+import os
 
 import config
+from date_parser import parse_date
+
+
+# Number of rows of header data at the start of the input CSV.
+HEADER_LINE_COUNT = 5
 
 
 def parse_to_float(value):
@@ -41,15 +57,7 @@ def extract_storage_values(row):
     @return: Dict of parsed and cleaned values. Includes a datetime.date object
         and dam storage levels for that date, as floats or None values.
     """
-    try:
-        date = datetime.datetime.strptime(row[0], "%d-%b-%y").date()
-    except ValueError:
-        # Handle irregularities in date values. The sequence of values for
-        # the month of May in 2017 follows a format with a forward slash
-        # and has inconsistent years in place of 2017. In one row, the
-        # month appears incorrectly as August.
-        date = datetime.datetime.strptime(row[0], "%d/%m/%Y").date()
-        date = date.replace(month=5, year=2017)
+    date = parse_date(row[0])
 
     wemmershoek_storage = parse_to_float(row[2])
     steensbras_lower_storage = parse_to_float(row[6])
@@ -153,6 +161,74 @@ def calc_percent_storage(row_dict):
     return out_dict
 
 
+def _read_lines(csv_in_path):
+    with open(csv_in_path, 'rb') as f_in:
+        return f_in.read().splitlines(keepends=True)
+
+
+def read_input_lines(csv_in_path=config.CSV_IN_PATH):
+    """Read the dam level CSV file and return its lines as bytes.
+
+    Lines are kept as bytes with their line endings, so that a range of lines
+    can be fingerprinted exactly as it is stored.
+
+    @param csv_in_path: Optional path of an input CSV in the same format as
+        the configured one.
+    """
+    print("Reading input CSV: {}".format(csv_in_path))
+
+    return _read_lines(csv_in_path)
+
+
+def has_storage_values(row_dict):
+    """Return True if a row has any published storage value.
+
+    Accepts a row in the format of either `extract_storage_values` or
+    `calc_percent_storage`. The zero used in place of a missing
+    Land-en-Zeezicht value is ignored.
+    """
+    return any(
+        v is not None for k, v in row_dict.items()
+        if k != 'Date' and not k.startswith('Land-en-Zeezicht')
+    )
+
+
+def process_lines(lines):
+    """Clean and process lines of data rows from the dam level CSV file.
+
+    Ignores the row values beyond today's date, since they are just empty
+    values against a date. Rows up to today are kept even if empty, but the
+    counts returned only go up to the last row with published values, since
+    empty rows may still be filled in later.
+
+    @param lines: Lines of the CSV as bytes, excluding header rows.
+
+    @return expanded_data: List of dictionaries, where each dict object
+        is in the format as set in `calc_percent_storage`.
+    @return published_count: Number of items at the start of expanded_data,
+        up to and including the last row with published values.
+    @return line_count: Number of lines up to and including the last row
+        with published values.
+    """
+    reader = csv.reader(
+        line.decode(config.CSV_IN_ENCODING) for line in lines
+    )
+    today = datetime.date.today()
+
+    expanded_data = []
+    published_count = line_count = 0
+    for row_tuple in reader:
+        row_dict = extract_storage_values(row_tuple)
+        if row_dict['Date'] <= today:
+            published = has_storage_values(row_dict)
+            expanded_data.append(calc_percent_storage(row_dict))
+            if published:
+                published_count = len(expanded_data)
+                line_count = reader.line_num
+
+    return expanded_data, published_count, line_count
+
+
 def process_input_csv():
     """Read in dam level CSV file and returns cleaned and processed rows.
 
@@ -164,38 +240,135 @@ def process_input_csv():
     @return expanded_data: List of dictionaries, where each dict object
         is in the format as set in `calc_percent_storage`.
     """
-    print("Reading input CSV: {}".format(config.CSV_IN_PATH))
+    lines = read_input_lines()
+    expanded_data, _, _ = process_lines(lines[HEADER_LINE_COUNT:])
 
-    with open(config.CSV_IN_PATH, encoding=config.CSV_IN_ENCODING) as f:
-        for i in range(5):
-            next(f, None)
+    return expanded_data
 
-        reader = csv.reader(f)
 
-        # Use a generator so that a row is only read when needed.
-        cleaned_data = (extract_storage_values(row_tuple) for row_tuple
-                        in reader)
+def parse_file(csv_in_path):
+    """Read and clean a single dam CSV export.
 
-        today = datetime.date.today()
-        expanded_data = [calc_percent_storage(row_dict) for row_dict
-                         in cleaned_data if row_dict['Date'] <= today]
+    @param csv_in_path: Path to the export.
 
-    return expanded_data
+    @return rows: List of dicts in the format set in `calc_percent_storage`,
+        for rows up to today.
+    @return line_count: Number of lines up to and including the last row
+        with published values, including header rows.
+    @throws: ValueError if a date appears more than once in the export.
+    """
+    lines = read_input_lines(csv_in_path)
+    rows, _, line_count = process_lines(lines[HEADER_LINE_COUNT:])
+
+    date_counts = collections.Counter(row['Date'] for row in rows)
+    duplicates = sorted(date for date, count in date_counts.items()
+                        if count > 1)
+    if duplicates:
+        raise ValueError("Duplicate dates in {}: {}".format(
+            csv_in_path,
+            ", ".join(str(date) for date in duplicates)
+        ))
 
+    return rows, HEADER_LINE_COUNT + line_count
 
-def write_csv():
-    """Procedure to read CSV input, process the data, then write a new CSV.
 
-    Prepare a header row, based on keys of the first row of input data.
+def find_paths(patterns):
+    """Return sorted list of unique absolute paths matching the patterns.
+
+    @param patterns: List of paths, glob patterns or directories. A
+        directory matches the CSV files within it, other than the output
+        CSV.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(
+                path for path in glob.glob(os.path.join(pattern, "*.csv"))
+                if os.path.abspath(path) != config.CSV_OUT_PATH
+            )
+        else:
+            paths.update(glob.glob(pattern))
+
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def merge_rows(parsed_files):
+    """Merge rows of cleaned exports into a single series sorted by date.
+
+    @param parsed_files: List of tuples as (path, rows), in increasing order
+        of precedence, where rows are as returned by `parse_file`.
+
+    @return merged: List of row dicts sorted by date.
+    @return overlaps: Dict of tuples as (older path, newer path) to a list of
+        dates which appear in both. Where a date appears in more than two
+        exports, it is only reported against the export which had the
+        row before.
+    """
+    merged = {}
+    sources = {}
+    overlaps = collections.defaultdict(list)
+
+    for path, rows in parsed_files:
+        for row in rows:
+            date = row['Date']
+            existing = merged.get(date)
+
+            if existing is not None:
+                overlaps[(sources[date], path)].append(date)
+                if (has_storage_values(existing)
+                        and not has_storage_values(row)):
+                    continue
+
+            merged[date] = row
+            sources[date] = path
+
+    return [merged[date] for date in sorted(merged)], dict(overlaps)
+
+
+def ingest_files(paths, workers=None):
+    """Parse exports in parallel and return the merged rows.
+
+    @param paths: List of paths of exports, in increasing order of
+        precedence.
+    @param workers: Maximum number of processes to use. Defaults to the
+        number of processors.
+
+    @return merged: List of row dicts sorted by date.
+    @return line_counts: List of the line counts of each export, as
+        returned by `parse_file`.
+    """
+    assert paths, "No input CSV paths to ingest"
+
+    if len(paths) == 1:
+        parsed = [parse_file(paths[0])]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            parsed = list(executor.map(parse_file, paths))
+
+    merged, overlaps = merge_rows(
+        [(path, rows) for path, (rows, _) in zip(paths, parsed)]
+    )
+
+    for (old_path, new_path), dates in sorted(overlaps.items()):
+        print("Overlap of {:,d} dates from {} to {}, preferring: {}".format(
+            len(dates),
+            min(dates),
+            max(dates),
+            new_path
+        ))
+        print("  {}".format(old_path))
+
+    return merged, [line_count for _, line_count in parsed]
+
+
+def get_header(row_dict):
+    """Return list of output column names, based on keys of a processed row.
+
     Sort columns alphabetically, to make it easy to find dams in the output.
     Then move the 'Date' to the far left as the index, followed by the columns
     of aggregated data which are of higher priority than the individual dams.
     """
-    processed_input_data = process_input_csv()
-
-    first_row_dict = processed_input_data[0].copy()
-    first_row_dict.pop('Date')
-    columns_names = sorted(first_row_dict.keys())
+    columns_names = sorted(k for k in row_dict.keys() if k != 'Date')
 
     aggregate_columns = []
     detail_columns = []
@@ -205,17 +378,248 @@ def write_csv():
         else:
             detail_columns.append(k)
 
-    header = ['Date'] + aggregate_columns + detail_columns
+    return ['Date'] + aggregate_columns + detail_columns
+
+
+def _get_line_date(line):
+    row_tuple = next(csv.reader([line.decode(config.CSV_IN_ENCODING)]))
+
+    return parse_date(row_tuple[0])
+
+
+def get_input_state(csv_in_path, lines, line_count):
+    """Return a fingerprint of the lines of an input CSV which were processed.
+
+    @param csv_in_path: Path of the input CSV.
+    @param lines: All lines of the input CSV as bytes.
+    @param line_count: Number of lines from the start of the input which
+        have been processed, including header rows.
+    """
+    return {
+        'path': csv_in_path,
+        'line_count': line_count,
+        'digest': hashlib.sha1(b"".join(lines[:line_count])).hexdigest(),
+    }
+
+
+def save_state(inputs, latest, last_date, output_size):
+    """Write out fingerprints of the input lines which have been processed.
+
+    @param inputs: List of dicts from `get_input_state`, one for each input
+        CSV in increasing order of precedence.
+    @param latest: Index in inputs of the input which the last processed row
+        is from, which is the only one expected to have rows added.
+    @param last_date: datetime.date of the last processed row.
+    @param output_size: Size in bytes of the output CSV up to the end of the
+        last processed row.
+    """
+    state = {
+        'inputs': inputs,
+        'latest': latest,
+        'last_date': str(last_date),
+        'output_size': output_size,
+    }
+    with open(config.STATE_PATH, 'w') as f_out:
+        json.dump(state, f_out, indent=2)
+
+
+def load_state(paths):
+    """Return the saved state if it still matches the input and output.
+
+    Only the latest input CSV may have lines added since the state was
+    saved. Any change to the other inputs means the merged rows must be
+    rebuilt.
+
+    @param paths: List of paths of the input CSVs, in increasing order of
+        precedence.
+
+    @return state: Dict of the saved state, or None if there is no saved
+        state, the output CSV is missing, the inputs are not the same files
+        or any of the previously processed lines of the inputs have changed.
+    @return lines: All lines as bytes of the latest input CSV, or None.
+    """
+    if not (os.path.exists(config.STATE_PATH)
+            and os.path.exists(config.CSV_OUT_PATH)):
+        return None, None
+
+    with open(config.STATE_PATH) as f_in:
+        state = json.load(f_in)
+
+    inputs = state.get('inputs')
+    if (not inputs or [i['path'] for i in inputs] != paths
+            or os.path.getsize(config.CSV_OUT_PATH) < state['output_size']):
+        return None, None
+
+    latest_lines = None
+    for i, input_state in enumerate(inputs):
+        lines = _read_lines(input_state['path'])
+        line_count = input_state['line_count']
+        if i == state['latest']:
+            latest_lines = lines
+        elif len(lines) != line_count:
+            return None, None
+        if get_input_state(input_state['path'], lines, line_count) \
+                != input_state:
+            return None, None
+
+    return state, latest_lines
+
+
+def write_rows(out_file, header, rows, published_count, write_header):
+    """Write out rows and return the output size after the published rows.
+
+    @return: Position in bytes of out_file after the published rows.
+    """
+    writer = csv.DictWriter(out_file, fieldnames=header)
+    if write_header:
+        writer.writeheader()
+
+    writer.writerows(rows[:published_count])
+    out_file.flush()
+    output_size = out_file.tell()
+    writer.writerows(rows[published_count:])
+
+    return output_size
+
+
+def write_csv(paths=None, workers=None):
+    """Procedure to read CSV inputs, process the data, then write a new CSV.
+
+    Prepare a header row, based on keys of the first row of input data.
+
+    @param paths: Optional list of paths of the input CSVs, in increasing
+        order of precedence. Defaults to those matching the configured
+        pattern.
+    @param workers: Maximum number of processes to parse with, as for
+        `ingest_files`.
+    """
+    if paths is None:
+        paths = find_paths([config.CSV_IN_PATTERN])
+    processed_input_data, line_counts = ingest_files(paths, workers)
+    published_count = next(
+        (i + 1 for i in reversed(range(len(processed_input_data)))
+         if has_storage_values(processed_input_data[i])),
+        0
+    )
+
+    header = get_header(processed_input_data[0])
 
     print("Writing output CSV: {}".format(config.CSV_OUT_PATH))
 
     with open(config.CSV_OUT_PATH, 'w') as out_file:
-        writer = csv.DictWriter(out_file, fieldnames=header)
+        output_size = write_rows(
+            out_file, header, processed_input_data, published_count,
+            write_header=True
+        )
+
+    if published_count:
+        last_date = processed_input_data[published_count-1]['Date']
+        input_lines = [_read_lines(path) for path in paths]
+        # The latest input is the one with the highest precedence whose last
+        # published row is the last date. Only its lines up to that row are
+        # fingerprinted, as rows are added to it. Other inputs are
+        # fingerprinted in full.
+        latest = max(
+            i for i, (lines, line_count)
+            in enumerate(zip(input_lines, line_counts))
+            if line_count > HEADER_LINE_COUNT
+            and _get_line_date(lines[line_count-1]) == last_date
+        )
+        inputs = [
+            get_input_state(
+                path, lines, line_count if i == latest else len(lines)
+            )
+            for i, (path, lines, line_count)
+            in enumerate(zip(paths, input_lines, line_counts))
+        ]
+        save_state(inputs, latest, last_date, output_size)
+    print("Done")
 
-        writer.writeheader()
-        writer.writerows(processed_input_data)
+
+def append_csv():
+    """Procedure to process only new rows of CSV input and append them.
+
+    The city publishes one new row a day, filling in a row which previously
+    had an empty value against a date in the latest export. Using the state
+    saved by the previous run, only the lines of the latest input after its
+    last published line are processed. The existing output CSV is truncated
+    after the last published row, to drop any empty rows written before, and
+    the new rows are appended. If there is no state, the inputs matching the
+    configured pattern are not the same files, or any line which was
+    processed before has changed, then fall back to rewriting the whole
+    output CSV from all the inputs.
+    """
+    paths = find_paths([config.CSV_IN_PATTERN])
+    state, lines = load_state(paths)
+
+    if state is None:
+        print("Input changed or no previous run found, rebuilding")
+        write_csv(paths)
+        return
+
+    latest = state['latest']
+    latest_input = state['inputs'][latest]
+    print("Reading input CSV: {}".format(latest_input['path']))
+    new_data, published_count, line_count = process_lines(
+        lines[latest_input['line_count']:]
+    )
+
+    if not published_count:
+        print("No new published rows after: {}".format(state['last_date']))
+        return
+    if str(new_data[0]['Date']) <= state['last_date']:
+        print("New rows are not after: {}, rebuilding".format(
+            state['last_date']
+        ))
+        write_csv(paths)
+        return
+
+    with open(config.CSV_OUT_PATH) as in_file:
+        header = next(csv.reader(in_file))
+
+    print("Appending {:,d} rows to output CSV: {}".format(
+        len(new_data),
+        config.CSV_OUT_PATH
+    ))
+    with open(config.CSV_OUT_PATH, 'r+') as out_file:
+        out_file.seek(state['output_size'])
+        out_file.truncate()
+        output_size = write_rows(
+            out_file, header, new_data, published_count,
+            write_header=False
+        )
+
+    inputs = list(state['inputs'])
+    inputs[latest] = get_input_state(
+        latest_input['path'],
+        lines,
+        latest_input['line_count'] + line_count
+    )
+    save_state(inputs, latest, new_data[published_count-1]['Date'],
+               output_size)
     print("Done")
 
 
+def main():
+    """
+    Command-line function to parse arguments and write the cleaned CSV.
+    """
+    parser = argparse.ArgumentParser(description="Dam CSV parser utility."
+                                     " Clean the dam levels CSV and write out"
+                                     " the processed data to a CSV file.")
+    parser.add_argument(
+        '-i', '--incremental',
+        action='store_true',
+        help="Only process rows added since the last run and append them to"
+            " the existing output, rebuilding only if earlier rows changed."
+    )
+    args = parser.parse_args()
+
+    if args.incremental:
+        append_csv()
+    else:
+        write_csv()
+
+
 if __name__ == '__main__':
-    write_csv()
+    main()
@@ -2,15 +2,21 @@
 """
 Dataframe explorer application file.
 
-Read in the raw input CSV, apply the cleaning logic as in `csv_parser`
-and then convert the dict object to a DataFrame, instead of writing to a CSV.
-The DataFrame is kept in memory and can be explored easily in iPython.
-No data is written out by this script.
-
-A benefit of the DataFrame is that it can be used to raise an error on any
-duplicate index values, which have to be solved by updating the cleaning
-logic. This was done previously to identify rows in the source CSV which
-have irregular date formats or values.
+Read in all the raw input CSV exports, apply the cleaning logic as in
+`csv_parser` and merge them as in `ingest`, then convert the dict object to
+a DataFrame, instead of writing to a CSV. The DataFrame is kept in memory and
+can be explored easily in iPython. No data is written out by this script.
+
+Duplicate dates within an export are raised as an error while merging,
+which have to be solved by updating the cleaning logic. This was done
+previously to identify rows in the source CSV which have irregular date
+formats or values. Dates which overlap between exports are reported and
+resolved by precedence, so the index is unique.
+
+Run the script interactively so that `df` is kept, such as with
+`python -i dataframe_explorer.py` or `%run dataframe_explorer.py` in iPython.
+The exports are read in worker processes, so the DataFrame is only built when
+run as a script, not on import. From another module, call `load_dataframe`.
 
 Some useful commands to apply in pandas:
 >>> df.columns
@@ -25,11 +31,25 @@ TODO: Consider how to force column to float and handle None / NaN.
 """
 import pandas
 
-from csv_parser import process_input_csv
+import config
+from csv_parser import find_paths, ingest_files
+
+
+def load_dataframe():
+    """Ingest the configured input CSV exports and return a DataFrame.
+
+    @return: DataFrame of cleaned and merged rows, indexed by date.
+    """
+    processed_input_data, _ = ingest_files(
+        find_paths([config.CSV_IN_PATTERN])
+    )
+
+    df = pandas.DataFrame(processed_input_data)
+    df = df.set_index('Date')
+    df.index = pandas.to_datetime(df.index)
 
+    return df
 
-processed_input_data = process_input_csv()
 
-df = pandas.DataFrame(processed_input_data)
-df = df.set_index('Date', verify_integrity=True)
-df.index = pandas.to_datetime(df.index)
+if __name__ == '__main__':
+    df = load_dataframe()
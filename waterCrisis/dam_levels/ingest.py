@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Ingest dam CSV exports.
+
+Read in any number of dam level CSV exports, such as the 2012-2018 export
+plus newer yearly exports, clean each of them in parallel across processes,
+then merge them into a single series by date and write out the cleaned CSV.
+
+Each export is cleaned with the same logic as in `csv_parser`. A date which
+appears more than once within one export is an error, as it means the
+cleaning logic needs to be updated for an irregular date format. A date
+which appears in more than one export is an overlap, which is resolved by
+precedence and reported:
+    - A row with published values wins over an empty row.
+    - Otherwise, the export later in sorted order of paths wins.
+
+The output replaces the CSV written by `csv_parser`, which reads all exports
+matching the configured pattern in the same way. The state of its incremental
+mode is saved for the exports read here, so a later incremental run only
+rebuilds if the exports matching the pattern are not the same ones.
+
+Usage:
+    $ ./ingest.py
+    $ ./ingest.py "var/Dam levels*.csv" --workers 2
+"""
+import argparse
+
+import config
+import csv_parser
+
+
+def main():
+    """
+    Command-line function to ingest exports and write the cleaned CSV.
+    """
+    parser = argparse.ArgumentParser(description="Dam CSV ingest utility."
+                                     " Clean and merge multiple dam level"
+                                     " exports into one CSV file.")
+    parser.add_argument(
+        'patterns',
+        metavar="PATH",
+        nargs='*',
+        default=[config.CSV_IN_PATTERN],
+        help="Paths, glob patterns or directories of exports to read."
+            " Defaults to: {}".format(config.CSV_IN_PATTERN)
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        help="Maximum number of processes to parse with."
+    )
+    args = parser.parse_args()
+
+    paths = csv_parser.find_paths(args.patterns)
+    print("Found {:,d} input CSV files".format(len(paths)))
+    csv_parser.write_csv(paths, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -49,18 +49,18 @@ class NewsItem(object):
         )
 
 
-def main(fpath):
-    with open(fpath) as f:
-        # Get document as single multi-line string.
-        html = f.read()
+def parse_news(html):
+    """Parse News24 water crisis HTML and return the unique news items.
 
-    #resp = requests.get(NEWS_URI, timeout=5)
-    #html = resp.text
+    @param html: HTML text of the water crisis listing page.
 
+    @return: List of NewsItem objects, unique by URI and in page order.
+    """
     soup = BeautifulSoup(html, 'html.parser')
 
-    # TODO check other classes and "last" variation
-    news_item_divs = soup.find_all('div', {'class': 'col300 news_item '})
+    # Match on a single class, since matching the whole class attribute
+    # string depends on the exact spacing and misses the "last" variation.
+    news_item_divs = soup.find_all('div', class_='news_item')
 
     news_items_dict = {}
 
@@ -90,7 +90,18 @@ def main(fpath):
                     )
                     news_items_dict[uri] = small_item
 
-    for v in news_items_dict.values():
+    return list(news_items_dict.values())
+
+
+def main(fpath):
+    with open(fpath) as f:
+        # Get document as single multi-line string.
+        html = f.read()
+
+    #resp = requests.get(NEWS_URI, timeout=5)
+    #html = resp.text
+
+    for v in parse_news(html):
         print(v)
 
 
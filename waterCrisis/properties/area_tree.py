@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Area tree application file.
+
+Build a tree of areas from the metadata CSV, as South Africa with provinces
+below it and their suburbs below those, and keep the values of the latest
+processed date on every node of the tree.
+
+The tree is built on the query index, which is kept up to date
+incrementally on disk as described in the query module, so the processed
+CSV is not scanned again. Each update of the tree brings the index up to
+date then only sets values on the nodes of areas which have rows after the
+date the tree was last updated to.
+
+Aggregates are the count-weighted average price and total count of
+properties across the suburbs below a node, as the province rollups of the
+index. The aggregates of the root are the sum of those of the provinces.
+Aggregates are over suburbs only, since the values of a province page
+already cover its suburbs.
+
+Aggregates only cover suburbs with values on the latest date. The values of
+each area's own page are kept on its node with their date, which is earlier
+than the date of the tree for an area missing from the latest date. Such
+values are marked as stale.
+
+Usage:
+    $ ./area_tree.py
+    $ ./area_tree.py western-cape
+    $ ./area_tree.py cape-town --parent western-cape
+"""
+import argparse
+import csv
+
+import config
+from query import PropertyIndex
+
+
+ROOT_NAME = 'south-africa'
+
+
+class AreaNode(object):
+    """Models an area in the hierarchy with aggregate values of its suburbs."""
+
+    def __init__(self, name, area_type, parent=None):
+        self.name = name
+        self.area_type = area_type
+        self.parent = parent
+        self.children = {}
+
+        # Values of this area's own page on the last date it was processed.
+        self.date = None
+        self.avg_price = None
+        self.property_count = None
+
+        # Aggregates across all suburbs at or below this node, on the date
+        # of the tree.
+        self.total_count = 0
+        self.weighted_sum = 0
+
+    def __repr__(self):
+        return "<AreaNode(name={name!r}, area_type={area_type!r},"\
+            " total_count={total_count}, mean_price={mean_price})>".format(
+                name=self.name,
+                area_type=self.area_type,
+                total_count=self.total_count,
+                mean_price=self.mean_price
+            )
+
+    @property
+    def mean_price(self):
+        """Count-weighted average price across all suburbs below, or None."""
+        if not self.total_count:
+            return None
+
+        return self.weighted_sum / self.total_count
+
+    def set_aggregates(self, weighted_sum, total_count):
+        self.weighted_sum = weighted_sum
+        self.total_count = total_count
+
+
+class AreaTree(object):
+    """Tree of areas, built from the metadata CSV and the query index."""
+
+    def __init__(self, index=None):
+        """
+        @param index: Optional PropertyIndex object. Defaults to the index of
+            the configured processed data CSV.
+        """
+        self.index = index or PropertyIndex()
+        self.root = AreaNode(ROOT_NAME, 'country')
+        # Lookup of (parent name, name) to node, for all but the root.
+        self.nodes = {}
+        # Latest date which values have been set for.
+        self.date = None
+
+    @classmethod
+    def from_metadata(cls, csv_path=config.METADATA_CSV_PATH, index=None):
+        """Build and return a tree from the rows of the metadata CSV."""
+        tree = cls(index)
+        with open(csv_path) as f_in:
+            for row in csv.DictReader(f_in):
+                tree.add(row['name'], row['area_type'], row['parent_name'])
+
+        return tree
+
+    def get(self, name, parent=None):
+        """Return the node for an area.
+
+        @param name: Name of the area.
+        @param parent: Name of the parent area. Only needed for suburbs.
+
+        @throws: KeyError if the area is not in the tree.
+        """
+        if name == ROOT_NAME:
+            return self.root
+
+        return self.nodes[(parent or ROOT_NAME, name)]
+
+    def add(self, name, area_type, parent_name):
+        """Add an area below its parent and return its node.
+
+        If the area exists already, its existing node is returned. A parent
+        which is not in the tree is added as a province.
+        """
+        key = (parent_name, name)
+        if key in self.nodes:
+            return self.nodes[key]
+
+        if parent_name == ROOT_NAME:
+            parent = self.root
+        else:
+            parent = self.add(parent_name, 'province', ROOT_NAME)
+        node = AreaNode(name, area_type, parent)
+        parent.children[name] = node
+        self.nodes[key] = node
+
+        return node
+
+    def is_stale(self, node):
+        """Return True if the values of a node are older than the tree."""
+        return node.date is not None and node.date != self.date
+
+    def update(self):
+        """Bring the index up to date and set values of areas with new rows.
+
+        Areas which are not in the tree are added.
+
+        @return: Count of areas with values set.
+        """
+        self.index.update()
+        if not self.index.dates or self.index.dates[-1] == self.date:
+            return 0
+
+        updated = 0
+        for key, area in self.index.areas.items():
+            if self.date is not None and area['dates'][-1] <= self.date:
+                continue
+            parent_name, name = key.split("|", 1)
+            node = self.add(name, area['area_type'], parent_name)
+            node.date = area['dates'][-1]
+            node.avg_price = area['prices'][-1]
+            node.property_count = area['counts'][-1]
+            updated += 1
+        self.date = self.index.dates[-1]
+
+        rollups = self.index.rollups.get(self.date, {})
+        weighted_sum = total_count = 0
+        for province in self.root.children.values():
+            province.set_aggregates(*rollups.get(province.name, (0, 0)))
+            weighted_sum += province.weighted_sum
+            total_count += province.total_count
+            for suburb in province.children.values():
+                if suburb.date == self.date:
+                    suburb.set_aggregates(
+                        suburb.avg_price * suburb.property_count,
+                        suburb.property_count
+                    )
+                else:
+                    suburb.set_aggregates(0, 0)
+        self.root.set_aggregates(weighted_sum, total_count)
+
+        return updated
+
+
+def main():
+    """
+    Command-line function to build the tree and print values of an area.
+    """
+    parser = argparse.ArgumentParser(description="Area tree utility. Print"
+                                     " aggregate values for an area and"
+                                     " its children.")
+    parser.add_argument('name', nargs='?', default=ROOT_NAME)
+    parser.add_argument('--parent')
+    args = parser.parse_args()
+
+    tree = AreaTree.from_metadata()
+    updated = tree.update()
+    print("Areas with values: {:,d} up to date: {}".format(
+        updated, tree.date or "-"
+    ))
+
+    node = tree.get(args.name, args.parent)
+    for area in [node] + sorted(node.children.values(),
+                                key=lambda child: child.name):
+        indent = "" if area is node else "  "
+        mean_price = area.mean_price
+        print("{}{:30} listings: {:>8,d}  mean price: {}{}".format(
+            indent,
+            area.name,
+            area.total_count,
+            "R{:,.0f}".format(mean_price) if mean_price else "-",
+            " (stale, last processed {})".format(area.date)
+            if tree.is_stale(area) else ""
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Batch process HTML application file.
+
+An alternative to `process_html.html_to_csv` for reprocessing large numbers
+of HTML files, which writes the same CSV. Instead of building a dict for
+each file and sorting the list of dicts, values are extracted into typed
+columns preallocated for the number of files:
+
+    dates: datetime64[D]
+    area types, parents and names: int32 codes of category labels
+    average prices and property counts: int64
+
+Rows are sorted with a NumPy lexsort on the columns, using the sorted rank
+of each label as its sort key, then written out in bulk.
+
+Values are extracted from the stats region of each page with a regular
+expression, which is much faster than building a BeautifulSoup tree. Any
+region which does not have the plain expected structure of exactly 4 span
+tags holding only text is parsed with BeautifulSoup as before, so that the
+values and errors are the same as `process_html.parse_property_stats`.
+
+A checkpoint and a ledger entry for each file are not written in batch
+mode, since a large reprocess can be run again in full.
+
+Usage:
+    $ ./batch_process.py
+    $ ./batch_process.py --start 2018-05 --end 2018-05 -w ~/may_2018.csv
+    $ ./batch_process.py --benchmark 100000
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import filecmp
+import html
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import config
+import delta_store
+from html_index import get_partition_dir, scan_html
+from html_reader import HtmlReader
+from ledger import RunLedger
+import process_html
+import quarantine
+from query import PropertyIndex
+
+
+FIELDNAMES = ['Date', 'Area Type', 'Parent', 'Name', 'Average Price',
+              'Property Count']
+PARAGRAPH_PATTERN = re.compile(r"<p[\s>]")
+SPAN_PATTERN = re.compile(r"<span[^>]*>([^<]*)</span>")
+
+
+def extract_stats(region):
+    """
+    Return average price and property count from the stats region of a page.
+
+    @param region: HTML text as returned by `HtmlReader.read`.
+
+    @return: Tuple of (avg_price, property_count), as for
+        `process_html.parse_property_stats`.
+    """
+    class_index = region.find("col-xs-11")
+    match = PARAGRAPH_PATTERN.search(region, class_index)
+    if class_index != -1 and match:
+        paragraph_end = region.find("</p>", match.end())
+        paragraph = region[match.end():paragraph_end]
+        if paragraph_end != -1 and "</div" not in region[:match.start()]:
+            spans = SPAN_PATTERN.findall(paragraph)
+            if len(spans) == 4 and paragraph.count("<span") == 4:
+                price_str = html.unescape(spans[1])
+                try:
+                    if price_str.startswith("R"):
+                        return (int(price_str[1:].replace("\xa0", "")),
+                                int(html.unescape(spans[2])))
+                except ValueError:
+                    pass
+
+    # Not the plain expected structure, so parse fully.
+    return process_html.parse_property_stats(region)
+
+
+class PropertyColumns(object):
+    """Preallocated typed columns of processed property data."""
+
+    def __init__(self, capacity):
+        """
+        @param capacity: Maximum number of rows.
+        """
+        self.dates = np.empty(capacity, dtype='datetime64[D]')
+        self.area_types = np.empty(capacity, dtype=np.int32)
+        self.parents = np.empty(capacity, dtype=np.int32)
+        self.names = np.empty(capacity, dtype=np.int32)
+        self.avg_prices = np.empty(capacity, dtype=np.int64)
+        self.property_counts = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+        # Labels of area types, parents and names, and lookup of their codes.
+        self.labels = []
+        self.codes = {}
+
+    def _get_code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+
+        return code
+
+    def append(self, date, area_type, parent_name, name, avg_price,
+               property_count):
+        """Add a row of values."""
+        i = self.size
+        self.dates[i] = date
+        self.area_types[i] = self._get_code(area_type)
+        self.parents[i] = self._get_code(parent_name)
+        self.names[i] = self._get_code(name)
+        self.avg_prices[i] = avg_price
+        self.property_counts[i] = property_count
+        self.size += 1
+
+    def get_order(self):
+        """Return indices of rows sorted by date, area type, parent and name.
+
+        This is the same order as sorting the rows by their string values.
+        """
+        label_order = sorted(range(len(self.labels)),
+                             key=self.labels.__getitem__)
+        ranks = np.empty(len(self.labels), dtype=np.int32)
+        ranks[label_order] = np.arange(len(self.labels), dtype=np.int32)
+
+        n = self.size
+        # The last key is the primary sort key.
+        return np.lexsort((
+            ranks[self.names[:n]],
+            ranks[self.parents[:n]],
+            ranks[self.area_types[:n]],
+            self.dates[:n],
+        ))
+
+    def write_csv(self, csv_out_path):
+        """Write the rows out sorted, in the format of the processed CSV."""
+        order = self.get_order()
+        labels = np.array(self.labels, dtype=object)
+        columns = (
+            np.datetime_as_string(self.dates[order]).tolist(),
+            labels[self.area_types[order]].tolist(),
+            labels[self.parents[order]].tolist(),
+            labels[self.names[order]].tolist(),
+            self.avg_prices[order].tolist(),
+            self.property_counts[order].tolist(),
+        )
+        with open(csv_out_path, 'w') as f_out:
+            writer = csv.writer(f_out)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(zip(*columns))
+
+
+def html_to_csv_batch(html_dir, start=None, end=None,
+                      csv_out_path=config.DATA_CSV_PATH,
+                      quarantine_mode=False, move_quarantined=False):
+    """
+    Read and parse HTML files into columns then write out a single CSV.
+
+    Arguments are as for `process_html.html_to_csv`.
+
+    @return: None
+    """
+    assert os.access(html_dir, os.R_OK), \
+        "Unable to read directory: {}".format(html_dir)
+    process_html.check_out_path(start, end, csv_out_path)
+
+    print("Finding .html files in directory: {}".format(html_dir))
+    html_files = scan_html(html_dir, start, end)
+    print("Extracting data from {:,d} HTML files".format(len(html_files)))
+
+    kept_rows = process_html.read_removed_rows(csv_out_path, html_dir,
+                                               html_files, start, end)
+
+    parse_start = time.time()
+    columns = PropertyColumns(len(html_files) + len(kept_rows))
+    reader = HtmlReader()
+    bad_data_pages = []
+    quarantined_pages = []
+    for html_file in html_files:
+        region, line_count = reader.read(html_file.path)
+        try:
+            avg_price, property_count = extract_stats(region)
+        except Exception as e:
+            if not quarantine_mode:
+                print("\nError parsing file: {}".format(html_file.path))
+                raise
+            reason = "{}: {}".format(type(e).__name__, e)
+            quarantine.add(html_file.path, reason, move=move_quarantined)
+            quarantined_pages.append(html_file.filename)
+            continue
+
+        if avg_price is None:
+            bad_data_pages.append((html_file.filename, line_count))
+        else:
+            columns.append(html_file.date, html_file.area_type,
+                           html_file.parent_name, html_file.name, avg_price,
+                           property_count)
+    reader.close()
+    for row in kept_rows:
+        columns.append(row['Date'], row['Area Type'], row['Parent'],
+                       row['Name'], int(row['Average Price']),
+                       int(row['Property Count']))
+    parse_duration = time.time() - parse_start
+
+    write_start = time.time()
+    print("Writing to: {}".format(csv_out_path))
+    columns.write_csv(csv_out_path)
+    write_duration = time.time() - write_start
+
+    reader.report()
+    print("Success")
+    print(" - file count: {:,d}".format(columns.size - len(kept_rows)))
+    print("Failed")
+    print(" - file count: {:,d}".format(len(bad_data_pages)))
+    for i, (filename, line_count) in enumerate(bad_data_pages):
+        print("  {index:4d}. {filename} ({line_count:,d} rows)".format(
+            index=i+1,
+            filename=filename,
+            line_count=line_count
+        ))
+    if quarantined_pages:
+        print("Quarantined")
+        print(" - file count: {:,d}".format(len(quarantined_pages)))
+        print(" - recorded in: {}".format(config.QUARANTINE_CSV_PATH))
+    print("Kept rows of removed pages: {:,d}".format(len(kept_rows)))
+    print("Parse duration: {:,.2f}s".format(parse_duration))
+    print("Sort and write duration: {:,.2f}s".format(write_duration))
+
+    if process_html.is_data_csv_path(csv_out_path):
+        print("Updating index: {}".format(config.DATA_INDEX_PATH))
+        PropertyIndex().update()
+        print("Updating delta store: {}".format(config.DATA_DELTA_PATH))
+        delta_store.update()
+
+
+def make_sample_files(html_dir, count):
+    """Write count HTML files of varied areas and dates, from the samples.
+
+    @return: None
+    """
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "sample")
+    with open(os.path.join(sample_dir, "city.html")) as f_in:
+        page = f_in.read()
+    area_count = 700
+    start = datetime.date(2018, 1, 1)
+
+    for i in range(count):
+        day, area = divmod(i, area_count)
+        date = start + datetime.timedelta(days=day)
+        filename = "suburb|province-{}|area-{}|{}|{}.html".format(
+            area % 9, area, area, date
+        )
+        # Vary the values, keeping the layout of the page.
+        html_text = page.replace("R 8&#160;554", "R {}&#160;554".format(
+            area + day
+        )).replace(">6063<", ">{}<".format(area * 3 + day))
+        out_dir = get_partition_dir(html_dir, date)
+        with open(os.path.join(out_dir, filename), 'w') as f_out:
+            f_out.write(html_text)
+
+
+def run_benchmark(count):
+    """Time processing of sample files with the current and batch paths.
+
+    @throws: AssertionError if the CSV outputs differ.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        html_dir = os.path.join(tmp_dir, "html")
+        os.makedirs(html_dir)
+        print("Writing {:,d} sample files to: {}".format(count, html_dir))
+        make_sample_files(html_dir, count)
+        # Build the listing cache of the partitions before timing.
+        scan_html(html_dir)
+
+        # Keep the ledger, metrics and checkpoint of the current path out of
+        # the configured var directory.
+        current_kwargs = dict(
+            checkpoint_path=os.path.join(tmp_dir, "checkpoint.jsonl"),
+            ledger=RunLedger('process_html', ledger_dir=tmp_dir,
+                             metrics_dir=tmp_dir)
+        )
+
+        timings = []
+        for name, function, kwargs in (
+                ('current', process_html.html_to_csv, current_kwargs),
+                ('batch', html_to_csv_batch, {})):
+            csv_out_path = os.path.join(tmp_dir, "{}.csv".format(name))
+            start = time.time()
+            with open(os.devnull, 'w') as f_null:
+                with contextlib.redirect_stdout(f_null):
+                    function(html_dir, csv_out_path=csv_out_path, **kwargs)
+            duration = time.time() - start
+            timings.append(duration)
+            print("{:8} {:8,.2f}s  {:10,.0f} files/s".format(
+                name, duration, count / duration
+            ))
+
+        assert filecmp.cmp(os.path.join(tmp_dir, "current.csv"),
+                           os.path.join(tmp_dir, "batch.csv"),
+                           shallow=False), "Outputs differ"
+        print("Outputs match")
+        print("Speedup: {:,.1f}x".format(timings[0] / timings[1]))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    """
+    Command-line function to parse arguments and read and write data.
+    """
+    parser = argparse.ArgumentParser(description="Batch process HTML utility."
+                                     " Parse HTML files into columns and"
+                                     " write out processed data to a single"
+                                     " CSV file.")
+    parser.add_argument(
+        '-r', '--read',
+        metavar="DIR_PATH",
+        help="Optionally choose a directory to read HTML files from."
+            " Defaults to: {}".format(config.HTML_OUT_DIR)
+    )
+    parser.add_argument('--start', metavar="YYYY[-MM[-DD]]")
+    parser.add_argument('--end', metavar="YYYY[-MM[-DD]]")
+    parser.add_argument(
+        '-w', '--write',
+        metavar="CSV_PATH",
+        default=config.DATA_CSV_PATH,
+        help="Optionally choose a CSV path to write to. Defaults to:"
+            " {}".format(config.DATA_CSV_PATH)
+    )
+    parser.add_argument(
+        '-q', '--quarantine',
+        action='store_true',
+        help="Record files which fail to parse in the quarantine CSV and"
+            " continue, instead of stopping."
+    )
+    parser.add_argument(
+        '-m', '--move-quarantined',
+        action='store_true',
+        help="Also move quarantined files into the quarantine directory."
+            " Implies --quarantine."
+    )
+    parser.add_argument(
+        '--benchmark',
+        metavar="COUNT",
+        type=int,
+        help="Instead of processing, time the current and batch paths on"
+            " this many sample files in a temporary directory."
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        return
+
+    if (args.start or args.end) and process_html.is_data_csv_path(args.write):
+        parser.error("--write is required with --start or --end, so that"
+                     " the full CSV is not replaced")
+
+    html_dir = args.read if args.read else config.HTML_OUT_DIR
+    html_to_csv_batch(
+        html_dir,
+        args.start,
+        args.end,
+        args.write,
+        quarantine_mode=args.quarantine or args.move_quarantined,
+        move_quarantined=args.move_quarantined
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fetch transports.
+
+Start local replay servers with injected latency, one serving HTTP/1.1 and
+one serving cleartext HTTP/2, then fetch the same URIs with the session
+transport from the first and with the http2 transport from the second.
+Print the duration, rate and connection counts of each.
+
+The request spacing is set to zero for the benchmark, so that it measures
+the transports and not the configured wait.
+
+The http2 transport and server need httpx and h2 installed:
+    $ pip install httpx[http2]
+
+Usage:
+    $ ./benchmark_transport.py
+    $ ./benchmark_transport.py --count 500 --latency 0.1 --streams 16
+"""
+import argparse
+import os
+import threading
+import time
+
+import config
+import replay_server
+import transport
+
+
+def start_server(server):
+    """Run a server in a background thread.
+
+    @return: Tuple of the thread and the base URI of the server.
+    """
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return thread, "http://{}:{}".format(*server.server_address)
+
+
+def stop_server(server, thread):
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def get_uris(host_domain, count):
+    """Return URIs of suburb pages, served by the fallback page."""
+    return [
+        "{}/property-values/area-{i}/western-cape/{i}".format(host_domain,
+                                                               i=i)
+        for i in range(count)
+    ]
+
+
+def run(fetcher, uris, batch_size):
+    """Fetch URIs in batches and return the duration in seconds.
+
+    @throws: AssertionError if any fetch did not succeed.
+    """
+    start = time.time()
+    for i in range(0, len(uris), batch_size):
+        for result in fetcher.fetch_many(uris[i:i+batch_size]):
+            assert result.status_code == 200, \
+                "Failed to fetch: {} {}".format(result.uri,
+                                                result.error or result.reason)
+
+    return time.time() - start
+
+
+def report(fetcher, replay, duration, count):
+    stats = fetcher.get_stats()
+    server_stats = replay.get_stats()
+    print("{}".format(stats['transport']))
+    print("  duration: {:,.2f}s".format(duration))
+    print("  rate: {:,.1f} requests/s".format(count / duration))
+    print("  client new connections: {:,d}".format(stats['connections']))
+    print("  server connections: {:,d}".format(
+        server_stats.get('connections', 0)
+    ))
+    print("  HTTP versions: {}".format(stats['http_versions']))
+
+
+def main():
+    """
+    Command-line function to run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the session and"
+                                     " HTTP/2 fetch transports against local"
+                                     " replay servers.")
+    parser.add_argument('--count', type=int, default=200,
+                        help="Number of URIs to fetch. Default: %(default)s")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="Seconds of server latency for each request."
+                        " Default: %(default)s")
+    parser.add_argument('--streams', type=int,
+                        default=config.HTTP2_MAX_STREAMS,
+                        help="Maximum HTTP/2 requests in flight."
+                        " Default: %(default)s")
+    args = parser.parse_args()
+
+    config.REQUEST_SPACING = 0.0
+    fallback_path = os.path.join(replay_server.SAMPLE_DIR, "city.html")
+    print("Fetching {:,d} URIs with {:.3f}s latency\n".format(
+        args.count, args.latency
+    ))
+
+    replay = replay_server.Replay({}, fallback_path, latency=args.latency)
+    server = replay_server.ReplayServer(("127.0.0.1", 0), replay)
+    thread, host_domain = start_server(server)
+    fetcher = transport.SessionTransport()
+    try:
+        duration = run(fetcher, get_uris(host_domain, args.count),
+                       config.FETCH_BATCH_SIZE)
+        report(fetcher, replay, duration, args.count)
+    finally:
+        fetcher.close()
+        stop_server(server, thread)
+    session_duration = duration
+
+    replay = replay_server.Replay({}, fallback_path, latency=args.latency)
+    server = replay_server.Http2ReplayServer(("127.0.0.1", 0), replay)
+    thread, host_domain = start_server(server)
+    fetcher = transport.Http2Transport(args.streams, host_domain)
+    try:
+        duration = run(fetcher, get_uris(host_domain, args.count),
+                       config.FETCH_BATCH_SIZE)
+        report(fetcher, replay, duration, args.count)
+    finally:
+        fetcher.close()
+        stop_server(server, thread)
+
+    print("\nSpeedup of http2: {:,.1f}x".format(session_duration / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,13 +7,24 @@ import os
 def _get_file_paths():
     """Build and return configured paths for reading and writing files.
 
+    The var directory can be set with the PROPERTY24_VAR_DIR environment
+    variable, such as for a run against a local replay server, so that its
+    output is kept apart from the real data.
+
     @return: Tuple of path to the following locations:
         - var directory.
         - CSV file to write area metadata.
         - directory to write out HTML files.
         - CSV file to write processed area data.
     """
-    var_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "var"))
+    var_path = os.environ.get('PROPERTY24_VAR_DIR')
+    if var_path:
+        var_path = os.path.abspath(os.path.expanduser(var_path))
+        os.makedirs(var_path, exist_ok=True)
+    else:
+        var_path = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "var")
+        )
     assert os.access(var_path, os.W_OK), \
         "Unable to write to var directory: {}".format(var_path)
 
@@ -27,11 +38,40 @@ def _get_file_paths():
 ### Paths
 
 VAR_PATH, METADATA_CSV_PATH, HTML_OUT_DIR, DATA_CSV_PATH = _get_file_paths()
+# Sidecar index of the processed data CSV, built by the query module.
+DATA_INDEX_PATH = os.path.join(VAR_PATH, "processed_data.index.json")
+# Delta-encoded copy of the processed data, built by the delta_store module.
+DATA_DELTA_PATH = os.path.join(VAR_PATH, "processed_data.delta.json.gz")
+# Directory for a JSON lines ledger of each run of the scrape and process
+# scripts, in a subdirectory for each script.
+LEDGER_DIR = os.path.join(VAR_PATH, "ledger")
+# Directory for metrics of the latest run of each script, written as JSON and
+# as Prometheus textfiles.
+METRICS_DIR = os.path.join(VAR_PATH, "metrics")
+# CSV of HTML files which failed to parse, with the reason, and a directory
+# which they may be moved to. See quarantine.py.
+QUARANTINE_CSV_PATH = os.path.join(VAR_PATH, "quarantine.csv")
+QUARANTINE_DIR = os.path.join(VAR_PATH, "quarantine")
+# CSV of pages removed by the retention script, so that the process scripts
+# keep their rows of the processed CSV. See retention.py.
+REMOVED_CSV_PATH = os.path.join(VAR_PATH, "removed_pages.csv")
+# Rows parsed so far by a run of the process script, so that an interrupted
+# run can be resumed.
+CHECKPOINT_PATH = os.path.join(VAR_PATH, "processed_data.checkpoint.jsonl")
 
 
 ### Locations
 
-HOST_DOMAIN = "https://www.property24.com"
+# Set the PROPERTY24_HOST_DOMAIN environment variable to fetch from another
+# host, such as a local replay server. See replay_server.py.
+# A separate var directory must then be set with PROPERTY24_VAR_DIR, so that
+# pages and metadata from that host are not mixed with the real data.
+DEFAULT_HOST_DOMAIN = "https://www.property24.com"
+HOST_DOMAIN = os.environ.get('PROPERTY24_HOST_DOMAIN', DEFAULT_HOST_DOMAIN)
+assert HOST_DOMAIN == DEFAULT_HOST_DOMAIN \
+    or os.environ.get('PROPERTY24_VAR_DIR'), \
+    "Set PROPERTY24_VAR_DIR to a separate directory when fetching from" \
+    " another host: {}".format(HOST_DOMAIN)
 PROVINCE_PATHS = {
     'western-cape': "/property-values/western-cape/9",
     'gauteng': "/property-values/gauteng/1",
@@ -72,6 +112,19 @@ REQUEST_HEADERS = {
 # by the server for excessive use. Set 0.0 to not wait.
 REQUEST_SPACING = 0.5
 
+# Transport to fetch pages with. Either 'session', for one request at a time
+# on a requests.Session, or 'http2', for many requests at a time over a single
+# HTTP/2 connection, which needs httpx[http2] installed and falls back to the
+# session transport if it is not. Set the PROPERTY24_TRANSPORT environment
+# variable to override this. See transport.py.
+TRANSPORT = os.environ.get('PROPERTY24_TRANSPORT', "session")
+# Number of URIs to hand to the transport at a time.
+FETCH_BATCH_SIZE = 50
+# Maximum number of requests in flight at once on the HTTP/2 connection, for
+# a host other than the live site, such as a local replay server. On the live
+# site, one request is in flight at a time with the request spacing.
+HTTP2_MAX_STREAMS = 8
+
 # If True, when scraping HTML then skip any local files which already exist,
 # otherwise do the request and overwrite the file. Overwriting should only
 # be necessary if there was an issue in the existing fetch and the files
@@ -80,3 +133,23 @@ SKIP_EXISTING = True
 
 # If True, be more verbose and print out a line when an item is skipped.
 SHOW_SKIPPED = False
+
+
+### Processing
+
+# Number of parsed HTML files to hold in memory before flushing them to the
+# checkpoint file.
+CHECKPOINT_BATCH_SIZE = 500
+
+
+### Retention
+
+# Keep a page for every day for this many days. See retention.py.
+RETENTION_DAILY_DAYS = 30
+# After that, keep the first page of each week for each area. Set to False to
+# keep every day.
+RETENTION_WEEKLY = True
+# Maximum size in bytes of the HTML directory. When over this, the oldest
+# months are thinned to the first page of the month for each area, until
+# under the budget. Set to None for no budget.
+RETENTION_DISK_BUDGET = 2 * 1024**3
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""
+Delta store application file.
+
+Store the processed property data as changes only, instead of a full row
+for every area on every day.
+
+Values of an area are stored as runs, where a run is a sequence of
+consecutive processed dates on which the average price and property count
+were unchanged. Dates are stored once for the whole store and runs refer to
+them by index, so a day missing for an area, such as when its page failed
+to parse, ends its run. The store is written as gzipped JSON.
+
+The store is kept up to date by the process scripts whenever they write the
+processed CSV. As for the query index, only the bytes appended to the CSV
+since the last update are read, unless the previously encoded bytes have
+changed, such as when an older page was reprocessed with a fixed parser, in
+which case the store is encoded again in full. The processed CSV is still
+written in full, since the queries and other modules read it, so the store
+is a compact copy of the history rather than a replacement for it.
+
+    {
+        'version': int,
+        'size': int,
+        'digest': str,
+        'dates': [str, ...],
+        'areas': {
+            "{area_type}|{parent_name}|{name}": [
+                [start_index, length, avg_price, property_count],
+                ...
+            ],
+            ...
+        }
+    }
+
+Usage:
+    $ ./delta_store.py encode
+    $ ./delta_store.py changes
+    $ ./delta_store.py decode ~/processed_data.csv
+"""
+import argparse
+import bisect
+import csv
+import gzip
+import io
+import json
+import os
+import time
+
+import config
+from file_digest import hash_prefix
+
+
+STORE_VERSION = 2
+FIELDNAMES = ['Date', 'Area Type', 'Parent', 'Name', 'Average Price',
+              'Property Count']
+
+
+def _area_key(row):
+    return "{}|{}|{}".format(row['Area Type'], row['Parent'], row['Name'])
+
+
+class DeltaStore(object):
+    """Run-length encoded values of all areas over all processed dates."""
+
+    def __init__(self, dates=None, areas=None, size=0, digest=None):
+        self.dates = dates or []
+        self.areas = areas or {}
+        # Count of bytes of the CSV which have been encoded and their hash.
+        self.size = size
+        self.digest = digest
+
+    @classmethod
+    def load(cls, path=config.DATA_DELTA_PATH, strict=True):
+        """Read a store from a gzipped JSON file and return it.
+
+        @param path: Path of the store.
+        @param strict: If False, return an empty store instead of raising
+            an error if the store was written by another version, so that
+            it is encoded again.
+
+        @throws: AssertionError if strict and the version is unexpected.
+        """
+        with gzip.open(path, 'rt') as f_in:
+            data = json.load(f_in)
+        if data['version'] != STORE_VERSION and not strict:
+            return cls()
+        assert data['version'] == STORE_VERSION, \
+            "Unexpected store version: {}".format(data['version'])
+
+        return cls(data['dates'], data['areas'], data['size'],
+                   data['digest'])
+
+    def save(self, path=config.DATA_DELTA_PATH):
+        """Write the store to a gzipped JSON file."""
+        data = {
+            'version': STORE_VERSION,
+            'size': self.size,
+            'digest': self.digest,
+            'dates': self.dates,
+            'areas': self.areas,
+        }
+        tmp_path = "{}.tmp".format(path)
+        with gzip.open(tmp_path, 'wt') as f_out:
+            json.dump(data, f_out, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def append(self, rows):
+        """Add rows of processed data for dates after those in the store.
+
+        @param rows: Iterable of dict objects in the format of rows of the
+            processed data CSV, sorted by date. Prices and counts may be
+            given as int or str values.
+
+        @return: Count of rows added.
+        @throws: ValueError if a row is dated before the last stored date.
+        """
+        added = 0
+        for row in rows:
+            date = row['Date']
+            if not self.dates or date > self.dates[-1]:
+                self.dates.append(date)
+            elif date != self.dates[-1]:
+                raise ValueError("Cannot append row dated {} before {}".format(
+                    date, self.dates[-1]
+                ))
+            index = len(self.dates) - 1
+            avg_price = int(row['Average Price'])
+            property_count = int(row['Property Count'])
+
+            runs = self.areas.setdefault(_area_key(row), [])
+            if runs and runs[-1][0] + runs[-1][1] == index \
+                    and runs[-1][2:] == [avg_price, property_count]:
+                runs[-1][1] += 1
+            else:
+                runs.append([index, 1, avg_price, property_count])
+            added += 1
+
+        return added
+
+    def _value_at(self, runs, index):
+        """Return (avg_price, property_count) of runs at a date index."""
+        pos = bisect.bisect_right(runs, [index, float('inf')]) - 1
+        if pos >= 0:
+            start, length, avg_price, property_count = runs[pos]
+            if index < start + length:
+                return avg_price, property_count
+
+        return None
+
+    def _make_row(self, date, key, value):
+        area_type, parent_name, name = key.split("|")
+        return {
+            'Date': date,
+            'Area Type': area_type,
+            'Parent': parent_name,
+            'Name': name,
+            'Average Price': value[0],
+            'Property Count': value[1]
+        }
+
+    def iter_rows(self):
+        """Yield every row of the full daily view.
+
+        Rows are in the same order as in the processed data CSV, by date
+        then area type, parent and name.
+        """
+        rows_by_date = [[] for _ in self.dates]
+        for key in sorted(self.areas, key=lambda k: k.split("|")):
+            for start, length, avg_price, property_count in self.areas[key]:
+                for index in range(start, start + length):
+                    rows_by_date[index].append(
+                        (key, (avg_price, property_count))
+                    )
+
+        for date, rows in zip(self.dates, rows_by_date):
+            for key, value in rows:
+                yield self._make_row(date, key, value)
+
+    def daily_view(self, date=None):
+        """Return rows of all areas for one date.
+
+        @param date: Date string as "YYYY-MM-DD". Defaults to the latest.
+
+        @return: List of dicts in the format of rows of the processed data
+            CSV, sorted by area.
+        """
+        index = self._date_index(date)
+        rows = []
+        for key in sorted(self.areas, key=lambda k: k.split("|")):
+            value = self._value_at(self.areas[key], index)
+            if value is not None:
+                rows.append(self._make_row(self.dates[index], key, value))
+
+        return rows
+
+    def _date_index(self, date):
+        if date is None:
+            return len(self.dates) - 1
+
+        index = bisect.bisect_left(self.dates, str(date))
+        if index == len(self.dates) or self.dates[index] != str(date):
+            raise KeyError("Date not in store: {}".format(date))
+
+        return index
+
+    def changes(self, date=None):
+        """Return areas which changed on a date compared with the date before.
+
+        @param date: Date string as "YYYY-MM-DD". Defaults to the latest.
+
+        @return: List of tuples as (area key, old value, new value), where
+            each value is a tuple of (avg_price, property_count), or None if
+            the area has no value on that date.
+        """
+        index = self._date_index(date)
+        changed = []
+        for key in sorted(self.areas, key=lambda k: k.split("|")):
+            runs = self.areas[key]
+            new = self._value_at(runs, index)
+            old = self._value_at(runs, index - 1) if index else None
+            if new != old:
+                changed.append((key, old, new))
+
+        return changed
+
+
+def update(csv_path=config.DATA_CSV_PATH, path=config.DATA_DELTA_PATH):
+    """Bring the store up to date with the processed data CSV.
+
+    Only the rows in the bytes appended to the CSV since the last update are
+    appended to the store. If the store does not exist or the previously
+    encoded bytes have changed, the store is encoded again in full.
+
+    @return: Count of rows added.
+    """
+    if os.path.exists(path):
+        store = DeltaStore.load(path, strict=False)
+    else:
+        store = DeltaStore()
+    csv_size = os.path.getsize(csv_path)
+    if (csv_size < store.size
+            or hash_prefix(csv_path, store.size) != store.digest):
+        store = DeltaStore()
+
+    with open(csv_path, 'rb') as f_in:
+        header = f_in.readline()
+        f_in.seek(max(store.size, len(header)))
+        new_bytes = f_in.read()
+
+    # Only encode complete lines, in case the CSV is being written.
+    end = new_bytes.rfind(b"\n") + 1
+    new_text = (header + new_bytes[:end]).decode()
+    added = store.append(csv.DictReader(io.StringIO(new_text)))
+
+    size = max(store.size, len(header)) + end
+    if size != store.size or not os.path.exists(path):
+        store.size = size
+        store.digest = hash_prefix(csv_path, size)
+        store.save(path)
+
+    return added
+
+
+def main():
+    """
+    Command-line function to encode, decode or report on the delta store.
+    """
+    parser = argparse.ArgumentParser(description="Delta store utility. Store"
+                                     " processed data as changes only.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser(
+        'encode',
+        help="Encode the processed data CSV into the delta store."
+    )
+    decode_parser = subparsers.add_parser(
+        'decode',
+        help="Write the full daily view of the delta store out to a CSV."
+    )
+    decode_parser.add_argument('csv_path')
+    changes_parser = subparsers.add_parser(
+        'changes',
+        help="Print areas which changed on a date."
+    )
+    changes_parser.add_argument('--date', metavar="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    if args.command == 'encode':
+        start = time.time()
+        if os.path.exists(config.DATA_DELTA_PATH):
+            os.remove(config.DATA_DELTA_PATH)
+        row_count = update()
+        store = DeltaStore.load()
+        run_count = sum(len(runs) for runs in store.areas.values())
+
+        print("Encoded rows: {:,d}".format(row_count))
+        print("Stored runs: {:,d}".format(run_count))
+        print("CSV size: {:,d} bytes".format(
+            os.path.getsize(config.DATA_CSV_PATH)
+        ))
+        print("Store size: {:,d} bytes".format(
+            os.path.getsize(config.DATA_DELTA_PATH)
+        ))
+        print("Duration: {:,.2f}s".format(time.time() - start))
+        print("Writing to: {}".format(config.DATA_DELTA_PATH))
+    elif args.command == 'decode':
+        store = DeltaStore.load()
+        print("Writing to: {}".format(args.csv_path))
+        with open(args.csv_path, 'w') as f_out:
+            writer = csv.DictWriter(f_out, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(store.iter_rows())
+    else:
+        if os.path.exists(config.DATA_DELTA_PATH):
+            store = DeltaStore.load()
+        else:
+            store = DeltaStore()
+        if not store.dates:
+            print("No dates in the store. Process the HTML files or encode"
+                  " the processed data CSV first.")
+            return
+        changed = store.changes(args.date)
+        print("Changed areas on {}: {:,d}".format(
+            args.date or store.dates[-1],
+            len(changed)
+        ))
+        for key, old, new in changed:
+            print("  {:50} {} -> {}".format(key, old, new))
+
+
+if __name__ == '__main__':
+    main()
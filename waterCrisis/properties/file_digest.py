@@ -0,0 +1,38 @@
+"""
+File digest.
+
+Digest the first part of a file, for the sidecar files which are updated
+incrementally from a CSV that is only appended to, such as the query index
+and the combined store. The digest of the bytes read so far is kept with the
+sidecar, so that a later update can tell whether those bytes have changed
+and it must rebuild, or only the bytes after them need to be read.
+
+This module imports no config, so that other modules can load it by path.
+"""
+import hashlib
+
+
+# Number of bytes to read at a time.
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_prefix(f_path, size):
+    """Return SHA-1 hex digest of the first `size` bytes of a file.
+
+    @param f_path: Path of the file to read.
+    @param size: Number of bytes to digest. If the file is shorter, all of
+        it is digested.
+
+    @return: Hex digest string.
+    """
+    digest = hashlib.sha1()
+    remaining = size
+    with open(f_path, 'rb') as f_in:
+        while remaining > 0:
+            chunk = f_in.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+"""
+HTML index application file.
+
+List stored HTML files of property pages by date range, without reading
+the names of files outside of that range.
+
+HTML files are stored in a directory for each month, named as "YYYY-MM",
+within the configured HTML directory. Files in the top level of the
+directory from before that layout was used are still listed, but all of them
+are checked on every listing, so they should be moved into partitions with
+the `--migrate` option.
+
+A partition may instead be compacted into a zip archive named as
+"YYYY-MM.zip", as done by retention.py. Files in an archive are listed with
+a path of the archive path joined with the filename, such as
+"unprocessed_html/2018-05.zip/{filename}", and are read from the archive
+with `open_html`, without extracting them to disk.
+
+The metadata parsed from the filenames in each partition is cached in a JSON
+file in an ".index" directory, which is used while the modification time
+of the partition directory or archive is unchanged. Adding or removing a
+file in a partition updates that time, so then the partition is scanned
+again.
+
+Usage:
+    $ ./html_index.py --start 2018-05 --end 2018-05
+    $ ./html_index.py --migrate
+"""
+import argparse
+import collections
+import json
+import os
+import re
+import zipfile
+
+import config
+
+
+METADATA_LOOKUP = {
+    'western_cape': {
+        'parent_name': "south-africa",
+        'area_type': "province",
+        'name': 'western-cape'
+    },
+    'cape_town': {
+        'parent_name': "western-cape",
+        'area_type': "suburb",
+        'name': 'cape-town'
+    }
+}
+
+INDEX_DIR_NAME = ".index"
+PARTITION_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+ARCHIVE_EXTENSION = ".zip"
+
+HtmlFile = collections.namedtuple(
+    'HtmlFile',
+    ['path', 'filename', 'area_type', 'parent_name', 'name', 'date']
+)
+
+
+def parse_curl_metadata(filename):
+    """
+    Use the details in a curl-generated HTML filename to extract metadata.
+
+    See the project's tools/scrape_pages_with_curl.sh bash script.
+
+    @param filename: The filename of the HTML file, without the extension.
+        Note that the filename has underscores but the returned values
+        have hyphens.
+
+        Format:
+            "property_24_{area}_{date}.html"
+        Examples:
+            "property_24_western_cape_2018-05-31.html"
+            "property_24_cape_town_2018-05-13.html"
+
+        Only those two areas are handled here, using hardcoded rules as the
+        bash script is not intended to be used to scale to many locations. The
+        other logic for parsing filenames easily covers all areas though.
+
+    @return: Tuple of metadata string values as
+        (area_type, parent_name, name, date).
+    """
+    metadata, _ = os.path.splitext(filename)
+    metadata = metadata.replace("property_24_", "")
+    name, date = metadata.rsplit("_", 1)
+
+    area_metadata = METADATA_LOOKUP[name]
+    area_type = area_metadata['area_type']
+    parent_name = area_metadata['parent_name']
+    name = area_metadata['name']
+
+    return area_type, parent_name, name, date
+
+
+def parse_filename(filename):
+    """
+    Extract metadata from the filename of an HTML file of a property page.
+
+    Filenames are mostly expected to be in style set in scrape_html.py.
+        "{area_type}|{parent_name}|{name}|{area_id}|{date}.html"
+    Example:
+        "suburb|northern-cape|marydale|539|2018-02-09.html"
+
+    An alternative style is accepted as explained in `parse_curl_metadata`.
+
+    @return: Tuple of metadata string values as
+        (area_type, parent_name, name, date).
+    """
+    if filename.startswith("property_24_"):
+        return parse_curl_metadata(filename)
+
+    metadata, _ = os.path.splitext(filename)
+    area_type, parent_name, name, _, date = metadata.split("|")
+
+    return area_type, parent_name, name, date
+
+
+def is_html_filename(filename):
+    """Return True if the filename is for an HTML file of a property page.
+
+    Ignore unrelated News24 files possibly created with the bash script
+    in the tools directory.
+    """
+    return filename.endswith(".html") and not filename.startswith("news24_")
+
+
+def get_partition_name(date):
+    """Return name of the partition directory for a date or date string."""
+    return str(date)[:7]
+
+
+def get_partition_dir(html_dir, date):
+    """Return path of the partition directory for a date, creating it.
+
+    @param html_dir: Path to the directory of HTML files.
+    @param date: datetime.date object or "YYYY-MM-DD" string.
+    """
+    partition_dir = os.path.join(html_dir, get_partition_name(date))
+    os.makedirs(partition_dir, exist_ok=True)
+
+    return partition_dir
+
+
+def in_range(value, start=None, end=None):
+    """Return True if a date string is within an inclusive range.
+
+    The start and end can be given to any precision, as "YYYY", "YYYY-MM"
+    or "YYYY-MM-DD", where values which match the end to that precision
+    are included.
+    """
+    if start and value < start[:len(value)]:
+        return False
+    if end and value[:len(end)] > end:
+        return False
+
+    return True
+
+
+def get_archive_name(partition_name):
+    """Return the filename of the archive of a partition."""
+    return partition_name + ARCHIVE_EXTENSION
+
+
+def split_archive_path(f_path):
+    """Return (archive path, filename) of a file in an archive, or None.
+
+    @param f_path: Path of an HTML file, as listed by `scan_html`.
+    """
+    archive_path, filename = os.path.split(f_path)
+    if (archive_path.endswith(ARCHIVE_EXTENSION)
+            and PARTITION_PATTERN.match(
+                os.path.basename(archive_path)[:-len(ARCHIVE_EXTENSION)]
+            )):
+        return archive_path, filename
+
+    return None
+
+
+def open_html(f_path, archives=None):
+    """Open an HTML file for reading as bytes, including from an archive.
+
+    @param f_path: Path of an HTML file, as listed by `scan_html`.
+    @param archives: Optional dict of archive paths to open ZipFile objects,
+        which is added to, so that an archive is only opened once across
+        files. Otherwise the archive is closed with the returned file.
+
+    @return: Tuple of (file object, size in bytes).
+    """
+    archive = split_archive_path(f_path)
+    if archive is None:
+        f_in = open(f_path, 'rb', buffering=0)
+        return f_in, os.fstat(f_in.fileno()).st_size
+
+    archive_path, filename = archive
+    if archives is None:
+        with zipfile.ZipFile(archive_path) as zip_file:
+            info = zip_file.getinfo(filename)
+            # The member keeps its own handle on the file, which is closed
+            # along with the member.
+            return zip_file.open(info), info.file_size
+
+    zip_file = archives.get(archive_path)
+    if zip_file is None:
+        zip_file = archives[archive_path] = zipfile.ZipFile(archive_path)
+    info = zip_file.getinfo(filename)
+
+    return zip_file.open(info), info.file_size
+
+
+def _index_path(html_dir, name):
+    return os.path.join(html_dir, INDEX_DIR_NAME, "{}.json".format(name))
+
+
+def _scan_partition(html_dir, name, mtime_ns):
+    """Return list of metadata of files in a partition, using the cache.
+
+    @param name: Name of the partition directory or archive.
+
+    @return: List of lists as [filename, area_type, parent_name, name, date].
+    """
+    index_path = _index_path(html_dir, name)
+    try:
+        with open(index_path) as f_in:
+            index = json.load(f_in)
+        if index['mtime_ns'] == mtime_ns:
+            return index['files']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    partition_path = os.path.join(html_dir, name)
+    if name.endswith(ARCHIVE_EXTENSION):
+        with zipfile.ZipFile(partition_path) as zip_file:
+            filenames = zip_file.namelist()
+    else:
+        with os.scandir(partition_path) as entries:
+            filenames = [entry.name for entry in entries]
+    files = [[filename, *parse_filename(filename)]
+             for filename in filenames if is_html_filename(filename)]
+
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, 'w') as f_out:
+            json.dump({'mtime_ns': mtime_ns, 'files': files}, f_out)
+    except OSError:
+        # The directory may be read-only, in which case the partition is
+        # scanned every time.
+        pass
+
+    return files
+
+
+def scan_html(html_dir, start=None, end=None):
+    """Return metadata of HTML files of property pages within a date range.
+
+    @param html_dir: Path to the directory of HTML files.
+    @param start: Optional first date to include, as a string as described
+        in `in_range`.
+    @param end: Optional last date to include, in the same format.
+
+    @return: List of HtmlFile objects, sorted by filename. A file is listed
+        once, even if it is also in an archive, such as after compaction of
+        a partition was interrupted, in which case the copy outside the
+        archive is listed.
+    """
+    html_files = []
+
+    with os.scandir(html_dir) as entries:
+        for entry in entries:
+            partition_name = entry.name
+            if entry.name.endswith(ARCHIVE_EXTENSION):
+                partition_name = entry.name[:-len(ARCHIVE_EXTENSION)]
+            is_partition = (entry.is_dir()
+                            or entry.name.endswith(ARCHIVE_EXTENSION))
+
+            if is_partition:
+                if (PARTITION_PATTERN.match(partition_name)
+                        and in_range(partition_name, start, end)):
+                    files = _scan_partition(
+                        html_dir, entry.name, entry.stat().st_mtime_ns
+                    )
+                    for filename, *metadata in files:
+                        path = os.path.join(html_dir, entry.name, filename)
+                        html_files.append(HtmlFile(path, filename, *metadata))
+            elif is_html_filename(entry.name):
+                metadata = parse_filename(entry.name)
+                html_files.append(HtmlFile(entry.path, entry.name, *metadata))
+
+    unique_files = {}
+    for html_file in html_files:
+        if not in_range(html_file.date, start, end):
+            continue
+        other = unique_files.get(html_file.filename)
+        if other is None or split_archive_path(other.path) is not None:
+            unique_files[html_file.filename] = html_file
+
+    return sorted(unique_files.values(),
+                  key=lambda html_file: html_file.filename)
+
+
+def migrate(html_dir):
+    """Move HTML files in the top level of a directory into partitions.
+
+    @return: Count of files moved.
+    """
+    moved = 0
+    with os.scandir(html_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and is_html_filename(entry.name):
+                _, _, _, date = parse_filename(entry.name)
+                out_dir = get_partition_dir(html_dir, date)
+                os.rename(entry.path, os.path.join(out_dir, entry.name))
+                moved += 1
+
+    return moved
+
+
+def main():
+    """
+    Command-line function to list HTML files or migrate them to partitions.
+    """
+    parser = argparse.ArgumentParser(description="HTML index utility. List"
+                                     " HTML files by date range or move them"
+                                     " into monthly partitions.")
+    parser.add_argument(
+        '-r', '--read',
+        metavar="DIR_PATH",
+        default=config.HTML_OUT_DIR,
+        help="Optionally choose a directory of HTML files. Defaults to: {}"
+            .format(config.HTML_OUT_DIR)
+    )
+    parser.add_argument('--start', metavar="YYYY[-MM[-DD]]")
+    parser.add_argument('--end', metavar="YYYY[-MM[-DD]]")
+    parser.add_argument(
+        '--migrate',
+        action='store_true',
+        help="Move files in the top level of the directory into partitions."
+    )
+    args = parser.parse_args()
+
+    if args.migrate:
+        print("Moved files: {:,d}".format(migrate(args.read)))
+    else:
+        html_files = scan_html(args.read, args.start, args.end)
+        for html_file in html_files:
+            print(html_file.path)
+        print("Found files: {:,d}".format(len(html_files)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+HTML reader.
+
+Read stored HTML files of property pages as bytes into a reusable buffer,
+count lines on the bytes and only decode the region of the page which the
+property stats are extracted from.
+
+Reading a page as text and splitting it on newlines allocates a string for
+the whole page plus a string for every line, only to count them. Here the
+buffer is allocated once for the largest page seen and nothing is allocated
+for counting.
+
+The region is from the opening tag of the first element with the
+"col-xs-11" class to the end of the first paragraph after it, which covers
+everything that `process_html.parse_property_stats` reads. If the region
+cannot be found as expected, the whole page is decoded instead, so that the
+parser still sees the same content as before.
+
+Files in compacted archives are read from the archive, which is kept open
+until the reader is closed.
+"""
+from html_index import open_html
+
+
+# Assume at least this size for the buffer, in bytes.
+MIN_BUFFER_SIZE = 256 * 1024
+# Estimated memory use of an empty str object and a list item pointer, used
+# to estimate the allocation of splitting text into lines.
+STR_OVERHEAD = 49
+POINTER_SIZE = 8
+
+
+class HtmlReader(object):
+    """Read HTML files into a reusable buffer and keep I/O statistics."""
+
+    def __init__(self):
+        self.buffer = bytearray(MIN_BUFFER_SIZE)
+        self.archives = {}
+
+        self.file_count = 0
+        self.bytes_read = 0
+        self.bytes_decoded = 0
+        self.full_decode_count = 0
+        self.line_count = 0
+
+    def _read_into_buffer(self, f_path):
+        """Read a file into the buffer and return the count of bytes."""
+        f_in, size = open_html(f_path, self.archives)
+        with f_in:
+            if size > len(self.buffer):
+                self.buffer = bytearray(size)
+
+            view = memoryview(self.buffer)
+            total = 0
+            while total < size:
+                count = f_in.readinto(view[total:size])
+                if not count:
+                    break
+                total += count
+            view.release()
+
+        return total
+
+    def _find_region(self, size):
+        """Return (start, end) of the stats region in the buffer, or None."""
+        buffer = self.buffer
+
+        class_pos = buffer.find(b"col-xs-11", 0, size)
+        if class_pos == -1:
+            return None
+
+        # The class must be an attribute of the opening div tag before it.
+        start = buffer.rfind(b"<div", 0, class_pos)
+        if start == -1 or buffer.find(b">", start, class_pos) != -1:
+            return None
+
+        end = buffer.find(b"</p>", class_pos, size)
+        if end == -1:
+            return None
+
+        return start, end + len(b"</p>")
+
+    def read(self, f_path):
+        """Read an HTML file and return the text to parse and line count.
+
+        @param f_path: Path of the HTML file.
+
+        @return html: Decoded text of the stats region of the page, or of
+            the whole page if the region was not found. An empty string if
+            the file is empty.
+        @return line_count: int as number of lines in the file, or 0 if the
+            file is empty.
+        """
+        size = self._read_into_buffer(f_path)
+        self.file_count += 1
+        self.bytes_read += size
+
+        if not size:
+            return "", 0
+
+        line_count = self.buffer.count(b"\n", 0, size) + 1
+        self.line_count += line_count
+
+        region = self._find_region(size)
+        if region is None:
+            region = (0, size)
+            self.full_decode_count += 1
+        start, end = region
+
+        html = self.buffer[start:end].decode()
+        self.bytes_decoded += end - start
+
+        return html, line_count
+
+    def report(self):
+        """Print I/O and allocation statistics, overall and per 1,000 files.
+
+        The allocation which was avoided is estimated as the text of every
+        whole page plus a string for each of its lines, less the text of the
+        regions which were decoded.
+        """
+        if not self.file_count:
+            return
+
+        avoided = (
+            2 * self.bytes_read
+            + self.line_count * (STR_OVERHEAD + POINTER_SIZE)
+            - self.bytes_decoded
+        )
+        per_thousand = 1000 / self.file_count
+
+        print("Read")
+        print(" - file count: {:,d}".format(self.file_count))
+        print(" - bytes read: {:,d} ({:,.0f} KB per 1,000 files)".format(
+            self.bytes_read,
+            self.bytes_read * per_thousand / 1024
+        ))
+        print(" - bytes decoded: {:,d} ({:,.0f} KB per 1,000 files)".format(
+            self.bytes_decoded,
+            self.bytes_decoded * per_thousand / 1024
+        ))
+        print(" - whole pages decoded: {:,d}".format(self.full_decode_count))
+        print(" - estimated allocation avoided: {:,.0f} KB per 1,000 files"
+              .format(avoided * per_thousand / 1024))
+
+    def close(self):
+        """Close any archives which were opened."""
+        for zip_file in self.archives.values():
+            zip_file.close()
+        self.archives = {}
@@ -0,0 +1,169 @@
+"""
+Run ledger.
+
+Record an entry for each item handled by a run of a script, such as each
+URI fetched or each HTML file parsed, to a JSON lines file for the run.
+When the run ends, write out metrics of the run as JSON and as a Prometheus
+textfile, for the node exporter's textfile collector to pick up.
+
+Ledger files are written as:
+    {LEDGER_DIR}/{job}/{run_id}.jsonl
+where the run ID is the start time to the microsecond and the process ID, so
+that runs started in the same second each get their own file.
+Metrics of the latest run of each job are written as:
+    {METRICS_DIR}/{job}.json
+    {METRICS_DIR}/{job}.prom
+
+Each ledger entry has the job, run ID, time and a status, plus any fields
+given by the script. Fields named "duration" and "bytes" are summed for
+the metrics.
+"""
+import collections
+import datetime
+import json
+import os
+import time
+
+import config
+
+
+METRIC_PREFIX = "water_crisis"
+
+
+def _write_atomic(path, text):
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, 'w') as f_out:
+        f_out.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunLedger(object):
+    """Ledger of a single run of a job. Use as a context manager."""
+
+    def __init__(self, job, ledger_dir=config.LEDGER_DIR,
+                 metrics_dir=config.METRICS_DIR):
+        """
+        @param job: Name of the job, such as the script name.
+        @param ledger_dir: Directory to write ledger files in.
+        @param metrics_dir: Directory to write metrics files in.
+        """
+        self.job = job
+        self.metrics_dir = metrics_dir
+        self.run_id = "{}-{}".format(
+            datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S.%f"),
+            os.getpid()
+        )
+        self.started = time.time()
+
+        self.status_counts = collections.Counter()
+        self.duration_sum = 0.0
+        self.bytes_sum = 0
+
+        job_dir = os.path.join(ledger_dir, job)
+        os.makedirs(job_dir, exist_ok=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.path = os.path.join(job_dir, "{}.jsonl".format(self.run_id))
+        self._f_out = open(self.path, 'x')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(failed=exc_type is not None)
+
+    def record(self, status, **fields):
+        """Write an entry for an item to the ledger.
+
+        @param status: Outcome of the item, such as 'ok' or 'error'.
+        @param fields: Any other values to record, which must be JSON
+            serializable.
+        """
+        entry = {
+            'job': self.job,
+            'run_id': self.run_id,
+            'time': time.time(),
+            'status': status,
+        }
+        entry.update(fields)
+        self._f_out.write(json.dumps(entry) + "\n")
+
+        self.status_counts[status] += 1
+        self.duration_sum += fields.get('duration') or 0.0
+        self.bytes_sum += fields.get('bytes') or 0
+
+    def get_metrics(self, failed=False):
+        """Return dict of metrics of the run so far."""
+        run_duration = time.time() - self.started
+        total = sum(self.status_counts.values())
+        errors = sum(count for status, count in self.status_counts.items()
+                     if status != 'ok' and status != 'skipped')
+
+        return {
+            'job': self.job,
+            'run_id': self.run_id,
+            'failed': failed,
+            'run_duration_seconds': run_duration,
+            'items_total': total,
+            'items_by_status': dict(self.status_counts),
+            'items_per_second': total / run_duration if run_duration else 0,
+            'error_ratio': errors / total if total else 0,
+            'item_duration_seconds_sum': self.duration_sum,
+            'run_bytes': self.bytes_sum,
+            'last_run_timestamp_seconds': self.started,
+        }
+
+    def _format_prometheus(self, metrics):
+        """Return metrics in the Prometheus text exposition format."""
+        job_label = 'job="{}"'.format(self.job)
+        lines = []
+
+        def add(name, help_text, metric_type, value, labels=job_label):
+            full_name = "{}_{}".format(METRIC_PREFIX, name)
+            lines.append("# HELP {} {}".format(full_name, help_text))
+            lines.append("# TYPE {} {}".format(full_name, metric_type))
+            lines.append("{}{{{}}} {}".format(full_name, labels, value))
+
+        add('run_duration_seconds', "Duration of the last run.", 'gauge',
+            metrics['run_duration_seconds'])
+        add('run_failed', "1 if the last run ended with an error.", 'gauge',
+            int(metrics['failed']))
+        add('items_per_second', "Items handled per second in the last run.",
+            'gauge', metrics['items_per_second'])
+        add('error_ratio', "Fraction of items which were not ok.", 'gauge',
+            metrics['error_ratio'])
+        add('item_duration_seconds_sum', "Sum of durations of items.",
+            'gauge', metrics['item_duration_seconds_sum'])
+        add('run_bytes', "Bytes fetched or read in the last run.", 'gauge',
+            metrics['run_bytes'])
+        add('last_run_timestamp_seconds', "Start time of the last run.",
+            'gauge', metrics['last_run_timestamp_seconds'])
+
+        full_name = "{}_items".format(METRIC_PREFIX)
+        lines.append("# HELP {} Items handled in the last run, by status."
+                     .format(full_name))
+        lines.append("# TYPE {} gauge".format(full_name))
+        for status, count in sorted(metrics['items_by_status'].items()):
+            lines.append('{}{{{},status="{}"}} {}'.format(
+                full_name, job_label, status, count
+            ))
+
+        return "\n".join(lines) + "\n"
+
+    def close(self, failed=False):
+        """Close the ledger and write out the metrics of the run.
+
+        @param failed: True if the run ended with an error.
+        """
+        if self._f_out.closed:
+            return
+        self._f_out.close()
+
+        metrics = self.get_metrics(failed)
+        _write_atomic(
+            os.path.join(self.metrics_dir, "{}.json".format(self.job)),
+            json.dumps(metrics, indent=2) + "\n"
+        )
+        _write_atomic(
+            os.path.join(self.metrics_dir, "{}.prom".format(self.job)),
+            self._format_prometheus(metrics)
+        )
@@ -64,7 +64,7 @@ def parse_path(path):
     }
 
 
-def main():
+def main(session=None):
     """Main function to prepare and write a property metadata CSV.
 
     Iterate through paths of configured provinces to fetch the HTML, and
@@ -78,10 +78,14 @@ def main():
     performance benefit, as per the documentation here:
         http://docs.python-requests.org/en/master/user/advanced/
 
+    @param session: Optional requests.Session to reuse across calls. A new
+        session is created if this is omitted.
+
     @return: None
     """
     paths = set()
-    session = requests.Session()
+    if session is None:
+        session = requests.Session()
 
     for province_name, province_path in config.PROVINCE_PATHS.items():
         print("Fetching data for: {0}".format(province_name))
@@ -5,65 +5,25 @@ Process HTML application file.
 Read property values for all HTML files in the configured directory,
 extract and process values, then write out to a single CSV, writing over
 any existing file. The CSV will have data for all areas and dates which
-were read in.
+were read in, plus the rows of the existing CSV for pages which the
+retention script removed from that directory.
 """
 import argparse
 import csv
-import glob
+import json
 import os
+import time
 
 from bs4 import BeautifulSoup
 
 import config
-
-
-METADATA_LOOKUP = {
-    'western_cape': {
-        'parent_name': "south-africa",
-        'area_type': "province",
-        'name': 'western-cape'
-    },
-    'cape_town': {
-        'parent_name': "western-cape",
-        'area_type': "suburb",
-        'name': 'cape-town'
-    }
-}
-
-
-def parse_curl_metadata(filename):
-    """
-    Use the details in a curl-generated HTML filename to extract metadata.
-
-    See the project's tools/scrape_pages_with_curl.sh bash script.
-
-    @param filename: The filename of the HTML file, without the extension.
-        Note that the filename has underscores but the returned values
-        have hyphens.
-
-        Format:
-            "property_24_{area}_{date}.html"
-        Examples:
-            "property_24_western_cape_2018-05-31.html"
-            "property_24_cape_town_2018-05-13.html"
-
-        Only those two areas are handled here, using hardcoded rules as the
-        bash script is not intended to be used to scale to many locations. The
-        other logic for parsing filenames easily covers all areas though.
-
-    @return: Tuple of metadata string values as
-        (area_type, parent_name, name, date).
-    """
-    metadata, _ = os.path.splitext(filename)
-    metadata = metadata.replace("property_24_", "")
-    name, date = metadata.rsplit("_", 1)
-
-    area_metadata = METADATA_LOOKUP[name]
-    area_type = area_metadata['area_type']
-    parent_name = area_metadata['parent_name']
-    name = area_metadata['name']
-
-    return area_type, parent_name, name, date
+import delta_store
+from html_index import in_range, parse_filename, scan_html
+from html_reader import HtmlReader
+from ledger import RunLedger
+import quarantine
+from query import PropertyIndex
+from retention import read_removed
 
 
 def parse_property_stats(html):
@@ -120,11 +80,15 @@ def parse_property_stats(html):
     return avg_price, property_count
 
 
-def parse_html(f_path):
+def parse_html(f_path, metadata=None, reader=None):
     """
     Parse HTML of a given filename and return processed data and line count.
 
     @param f_path: Path HTML file to open and parse.
+    @param metadata: Optional tuple of (area_type, parent_name, name, date),
+        if already parsed from the filename.
+    @param reader: Optional HtmlReader object to read the file with, so that
+        its buffer is reused and statistics are kept across files.
 
     @return row_data: dict of processed data with the following format:
             {
@@ -140,19 +104,15 @@ def parse_html(f_path):
     @return filename: Name of HTML, extracted from f_path value.
     @return line_count: int as number of lines in the input text file.
     """
-    with open(f_path) as f_in:
-        html = f_in.read()
+    if reader is None:
+        reader = HtmlReader()
+    html, line_count = reader.read(f_path)
 
     filename = os.path.basename(f_path)
-    line_count = len(html.split("\n")) if html else 0
 
-    # TODO: Refactor the 2nd to be a function or to have the conditional inside
-    # a function.
-    if filename.startswith("property_24_"):
-        area_type, parent_name, name, date = parse_curl_metadata(filename)
-    else:
-        metadata, _ = os.path.splitext(filename)
-        area_type, parent_name, name, _, date = metadata.split("|")
+    if metadata is None:
+        metadata = parse_filename(filename)
+    area_type, parent_name, name, date = metadata
 
     try:
         avg_price, property_count = parse_property_stats(html)
@@ -176,22 +136,145 @@ def parse_html(f_path):
     return row_data, filename, line_count
 
 
-def html_to_csv(html_dir):
+def read_checkpoint(run_args, checkpoint_path=config.CHECKPOINT_PATH):
     """
-    Read and parse HTML files then write out processed data to a single CSV.
+    Read entries of files done by an interrupted run from the checkpoint.
+
+    A line which was only partly written when the run was interrupted is
+    ignored, along with anything after it.
+
+    @param run_args: dict of arguments of the run, which must match those
+        the checkpoint was written for.
+
+    @return: dict of HTML file paths to checkpoint entries.
+    @throws: ValueError if the checkpoint was written for other arguments.
+    """
+    done = {}
+    if not os.path.exists(checkpoint_path):
+        return done
+
+    with open(checkpoint_path) as f_in:
+        try:
+            header = json.loads(f_in.readline())
+        except ValueError:
+            return done
+        if header != run_args:
+            raise ValueError("Checkpoint was written for a run with other"
+                             " arguments, so run without resuming to start"
+                             " over: {}".format(header))
+        for line in f_in:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            done[entry['path']] = entry
+
+    return done
+
+
+def write_checkpoint_entries(f_out, entries):
+    """Append checkpoint entries and flush them to disk."""
+    for entry in entries:
+        f_out.write(json.dumps(entry) + "\n")
+    f_out.flush()
+    os.fsync(f_out.fileno())
+
+
+def read_removed_rows(csv_path, html_dir, html_files, start=None,
+                      end=None):
+    """Return rows of an existing CSV for pages removed by retention.
+
+    Pages removed by the retention script have no HTML file, so their rows
+    are carried over from the CSV rather than dropped when it is written
+    again. A row is kept if it is within the date range, its page was
+    recorded as removed from the directory and no HTML file of the same area
+    and date was found, whether or not that file parsed. Rows of any other
+    page without an HTML file are dropped.
+
+    @param csv_path: Path of the CSV which is about to be written.
+    @param html_dir: Path of the directory which the HTML files were found
+        in.
+    @param html_files: List of HtmlFile objects which were found.
+    @param start: Optional first date of the range, as for `scan_html`.
+    @param end: Optional last date of the range.
+
+    @return: List of dict objects of CSV rows, with values as strings.
+    """
+    removed = read_removed(html_dir)
+    if not removed or not os.path.exists(csv_path):
+        return []
+
+    removed -= {(html_file.date, html_file.area_type, html_file.parent_name,
+                 html_file.name) for html_file in html_files}
+    with open(csv_path) as f_in:
+        return [
+            row for row in csv.DictReader(f_in)
+            if in_range(row['Date'], start, end) and (
+                row['Date'], row['Area Type'], row['Parent'], row['Name']
+            ) in removed
+        ]
+
+
+def is_data_csv_path(csv_path):
+    """Return True if a path is the configured processed data CSV."""
+    return os.path.abspath(csv_path) == os.path.abspath(config.DATA_CSV_PATH)
+
+
+def check_out_path(start, end, csv_out_path):
+    """Refuse to write a date range over the full processed CSV.
+
+    @throws: AssertionError if a start or end date is given and the CSV
+        path is the configured path.
+    """
+    assert not ((start or end) and is_data_csv_path(csv_out_path)), \
+        "Choose a CSV path to write a date range to, so that the full CSV" \
+        " is not replaced: {}".format(config.DATA_CSV_PATH)
+
 
-    HTML filenames are mostly expected to be in style set in scrape_html.py.
-        "{area_type}|{parent_name}|{name}|{area_id}|{date}.html"
-    Example:
-        "suburb|northern-cape|marydale|539|2018-02-09.html"
+def html_to_csv(html_dir, start=None, end=None,
+                csv_out_path=config.DATA_CSV_PATH, quarantine_mode=False,
+                move_quarantined=False, resume=False,
+                batch_size=config.CHECKPOINT_BATCH_SIZE,
+                checkpoint_path=config.CHECKPOINT_PATH, ledger=None):
+    """
+    Read and parse HTML files then write out processed data to a single CSV.
 
-    An alternative style is accepted as explained in `parse_curl_metadata`
-    function of this script.
+    HTML files are found in monthly partitions of the directory, or its top
+    level, as described in the html_index module. Filename styles are as
+    covered in `html_index.parse_filename`.
 
     TODO: Two input directories but one output file? Or two output files or
     merge inputs directories?
 
     @param html_dir: Path to directory of HTML files to parse.
+    @param start: Optional first date to include, such as "2018-05".
+    @param end: Optional last date to include, such as "2018-05".
+    @param csv_out_path: Path of the CSV to write to. The index for queries
+        is only updated when writing to the configured path. This must be
+        another path if a start or end date is given.
+
+    Rows of the existing CSV for pages which the retention script removed
+    from the directory are kept, as described in `read_removed_rows`.
+
+    Each file is recorded in a run ledger, with its parse duration, size,
+    line count and status, and metrics of the run are written when it ends.
+
+    Parsed files are flushed to the checkpoint file in batches, so that a
+    run which is interrupted can be resumed without parsing those files
+    again. The checkpoint is removed once the CSV is written.
+
+    @param quarantine_mode: If True, record a file which fails to parse in
+        the quarantine CSV and continue, instead of raising the error.
+    @param move_quarantined: If True, also move the file into the quarantine
+        directory.
+    @param resume: If True, continue from the checkpoint of an interrupted
+        run with the same arguments. Otherwise start over.
+    @param batch_size: Number of files to parse between flushes of the
+        checkpoint.
+    @param checkpoint_path: Path of the checkpoint file.
+    @param ledger: Optional RunLedger object to record files in, which is
+        closed when the run ends. Defaults to a new ledger for the
+        process_html job.
 
     @return: None
     """
@@ -203,40 +286,113 @@ def html_to_csv(html_dir):
 
     assert os.access(html_dir, os.R_OK), \
         "Unable to read directory: {}".format(html_dir)
+    check_out_path(start, end, csv_out_path)
 
     print("Finding .html files in directory: {}".format(html_dir))
-    html_paths = glob.glob(
-        os.path.join(html_dir, "*.html")
-    )
-    # Ignore unrelated News24 files possibly created with the bash script
-    # in the tools directory.
-    html_paths = [path for path in html_paths
-                  if not os.path.basename(path).startswith("news24_")]
-    html_paths.sort()
+    html_files = scan_html(html_dir, start, end)
 
-    print("Extracting data from {} HTML files".format(len(html_paths)))
+    print("Extracting data from {} HTML files".format(len(html_files)))
 
+    run_args = {
+        'html_dir': os.path.abspath(html_dir),
+        'start': start,
+        'end': end,
+        'csv_out_path': os.path.abspath(csv_out_path)
+    }
+    done = read_checkpoint(run_args, checkpoint_path) if resume else {}
+    if done:
+        print("Resuming from checkpoint with files: {:,d}".format(len(done)))
+    # Write out again what was read, which drops any partly written line.
+    checkpoint = open(checkpoint_path, 'w')
+    write_checkpoint_entries(checkpoint, [run_args] + list(done.values()))
+
+    reader = HtmlReader()
     success_line_counts = []
-    for i, f_path in enumerate(html_paths):
-        row_data, filename, line_count = parse_html(f_path)
-
-        if row_data:
-            property_out_data.append(row_data)
-            success_line_counts.append(line_count)
-        else:
-            bad_data_pages.append(
-                (filename, line_count)
-            )
-        if (i+1) % 10 == 0:
-            print("{:4d} done".format(i+1))
+    quarantined_pages = []
+    batch = []
+    if ledger is None:
+        ledger = RunLedger('process_html')
+    with checkpoint, ledger:
+        for i, html_file in enumerate(html_files):
+            entry = done.get(html_file.path)
+            if entry:
+                ledger.record('skipped', file=html_file.filename)
+            else:
+                metadata = (html_file.area_type, html_file.parent_name,
+                            html_file.name, html_file.date)
+                parse_start = time.time()
+                bytes_before = reader.bytes_read
+                try:
+                    row_data, filename, line_count = parse_html(
+                        html_file.path, metadata, reader
+                    )
+                    status = 'ok' if row_data else 'no_data'
+                    reason = None
+                except Exception as e:
+                    row_data, filename, line_count = \
+                        None, html_file.filename, None
+                    status = 'quarantined' if quarantine_mode else 'error'
+                    reason = "{}: {}".format(type(e).__name__, e)
+                    if not quarantine_mode:
+                        ledger.record(
+                            status,
+                            file=filename,
+                            duration=time.time() - parse_start,
+                            bytes=reader.bytes_read - bytes_before,
+                            reason=reason
+                        )
+                        write_checkpoint_entries(checkpoint, batch)
+                        raise
+                    quarantine.add(html_file.path, reason,
+                                   move=move_quarantined)
+                ledger.record(
+                    status,
+                    file=filename,
+                    duration=time.time() - parse_start,
+                    bytes=reader.bytes_read - bytes_before,
+                    line_count=line_count,
+                    reason=reason
+                )
+                entry = {
+                    'path': html_file.path,
+                    'status': status,
+                    'filename': filename,
+                    'line_count': line_count,
+                    'reason': reason,
+                    'row': row_data
+                }
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    write_checkpoint_entries(checkpoint, batch)
+                    batch = []
+
+            if entry['status'] == 'ok':
+                property_out_data.append(entry['row'])
+                success_line_counts.append(entry['line_count'])
+            elif entry['status'] == 'no_data':
+                bad_data_pages.append(
+                    (entry['filename'], entry['line_count'])
+                )
+            else:
+                quarantined_pages.append(
+                    (entry['filename'], entry['reason'])
+                )
+            if (i+1) % 10 == 0:
+                print("{:4d} done".format(i+1))
+
+        write_checkpoint_entries(checkpoint, batch)
 
+    reader.report()
+    reader.close()
+    print("Ledger: {}".format(ledger.path))
     print("Success")
     print(" - file count: {:,d}".format(len(property_out_data)))
-    print(" - average line count: {:2,.1f}".format(
-        (sum(success_line_counts)/len(success_line_counts))
-    ))
-    print(" - max line count: {:,d}".format(max(success_line_counts)))
-    print(" - min line count: {:,d}".format(min(success_line_counts)))
+    if success_line_counts:
+        print(" - average line count: {:2,.1f}".format(
+            (sum(success_line_counts)/len(success_line_counts))
+        ))
+        print(" - max line count: {:,d}".format(max(success_line_counts)))
+        print(" - min line count: {:,d}".format(min(success_line_counts)))
 
     print("Failed")
     print(" - file count: {:,d}".format(len(bad_data_pages)))
@@ -248,16 +404,40 @@ def html_to_csv(html_dir):
             line_count=line_count
         ))
 
-    print("Writing to: {}".format(config.DATA_CSV_PATH))
+    if quarantined_pages:
+        print("Quarantined")
+        print(" - file count: {:,d}".format(len(quarantined_pages)))
+        print(" - recorded in: {}".format(config.QUARANTINE_CSV_PATH))
+        print(" - items:")
+        for i, (filename, reason) in enumerate(quarantined_pages):
+            print("  {index:4d}. {filename}\n        {reason}".format(
+                index=i+1,
+                filename=filename,
+                reason=reason.splitlines()[0]
+            ))
+
+    kept_rows = read_removed_rows(csv_out_path, html_dir, html_files, start,
+                                  end)
+    print("Kept rows of removed pages: {:,d}".format(len(kept_rows)))
+    property_out_data.extend(kept_rows)
+
+    print("Writing to: {}".format(csv_out_path))
     fieldnames = ['Date', 'Area Type', 'Parent', 'Name', 'Average Price',
                   'Property Count']
-    with open(config.DATA_CSV_PATH, 'w') as f_out:
+    with open(csv_out_path, 'w') as f_out:
         writer = csv.DictWriter(f_out, fieldnames=fieldnames)
         writer.writeheader()
         property_out_data.sort(
             key=lambda x: (x['Date'], x['Area Type'], x['Parent'], x['Name'])
         )
         writer.writerows(property_out_data)
+    os.remove(checkpoint_path)
+
+    if is_data_csv_path(csv_out_path):
+        print("Updating index: {}".format(config.DATA_INDEX_PATH))
+        PropertyIndex().update()
+        print("Updating delta store: {}".format(config.DATA_DELTA_PATH))
+        delta_store.update()
 
 
 def main():
@@ -274,10 +454,68 @@ def main():
             " exist outside the project. Omit this option to use the"
             " configured default: {}".format(config.HTML_OUT_DIR)
     )
+    parser.add_argument(
+        '--start',
+        metavar="YYYY[-MM[-DD]]",
+        help="Optionally only process files from this date."
+    )
+    parser.add_argument(
+        '--end',
+        metavar="YYYY[-MM[-DD]]",
+        help="Optionally only process files up to this date."
+    )
+    parser.add_argument(
+        '-w', '--write',
+        metavar="CSV_PATH",
+        default=config.DATA_CSV_PATH,
+        help="Optionally choose a CSV path to write to. Required when"
+            " processing a date range. Defaults to: {}".format(
+                config.DATA_CSV_PATH
+            )
+    )
+    parser.add_argument(
+        '-q', '--quarantine',
+        action='store_true',
+        help="Record files which fail to parse in the quarantine CSV and"
+            " continue, instead of stopping. See: {}".format(
+                config.QUARANTINE_CSV_PATH
+            )
+    )
+    parser.add_argument(
+        '-m', '--move-quarantined',
+        action='store_true',
+        help="Also move quarantined files into the quarantine directory."
+            " Implies --quarantine."
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Continue an interrupted run with the same arguments, from its"
+            " checkpoint."
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=config.CHECKPOINT_BATCH_SIZE,
+        help="Number of files to parse between flushes of the checkpoint."
+            " Default: %(default)s"
+    )
     args = parser.parse_args()
+    if (args.start or args.end) and is_data_csv_path(args.write):
+        parser.error("--write is required with --start or --end, so that"
+                     " the full CSV is not replaced")
 
     html_dir = args.read if args.read else config.HTML_OUT_DIR
-    html_to_csv(html_dir)
+    html_to_csv(
+        html_dir,
+        args.start,
+        args.end,
+        args.write,
+        quarantine_mode=args.quarantine or args.move_quarantined,
+        move_quarantined=args.move_quarantined,
+        resume=args.resume,
+        batch_size=args.batch_size
+    )
 
 
 if __name__ == '__main__':
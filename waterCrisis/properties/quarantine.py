@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Quarantine application file.
+
+Keep a record of HTML files which could not be parsed, such as when the
+layout of the page has changed, so that a run of the process script can
+continue past them. Each file is appended to the quarantine CSV with the
+reason, and can optionally be moved out of the HTML directory into the
+quarantine directory, so that it is not read again by later runs.
+
+Usage:
+    $ ./quarantine.py
+"""
+import csv
+import datetime
+import os
+
+import config
+from html_index import split_archive_path
+
+
+FIELDNAMES = ['Quarantined', 'Filename', 'Path', 'Reason']
+
+
+def add(f_path, reason, move=False, csv_path=config.QUARANTINE_CSV_PATH,
+        quarantine_dir=config.QUARANTINE_DIR):
+    """Record a file which could not be parsed, and optionally move it.
+
+    @param f_path: Path of the HTML file.
+    @param reason: Description of the error.
+    @param move: If True, move the file into the quarantine directory.
+        A file in a compacted archive is recorded but not moved.
+
+    @return: Path of the file, after any move.
+    """
+    if move and split_archive_path(f_path) is None:
+        os.makedirs(quarantine_dir, exist_ok=True)
+        new_path = os.path.join(quarantine_dir, os.path.basename(f_path))
+        os.replace(f_path, new_path)
+        f_path = new_path
+
+    is_new = not os.path.exists(csv_path)
+    with open(csv_path, 'a') as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=FIELDNAMES)
+        if is_new:
+            writer.writeheader()
+        writer.writerow({
+            'Quarantined': datetime.datetime.now().isoformat(
+                timespec='seconds'
+            ),
+            'Filename': os.path.basename(f_path),
+            'Path': f_path,
+            'Reason': reason
+        })
+
+    return f_path
+
+
+def read_quarantined(csv_path=config.QUARANTINE_CSV_PATH):
+    """Return dict of filenames to the latest quarantine row of each file."""
+    if not os.path.exists(csv_path):
+        return {}
+
+    with open(csv_path) as f_in:
+        return {row['Filename']: row for row in csv.DictReader(f_in)}
+
+
+def main():
+    """
+    Command-line function to print quarantined files and reasons.
+    """
+    quarantined = read_quarantined()
+    print("Quarantined files: {:,d}".format(len(quarantined)))
+    for filename, row in sorted(quarantined.items()):
+        print("  {} ({})".format(filename, row['Quarantined']))
+        print("    {}".format(row['Reason'].splitlines()[0]))
+
+
+if __name__ == '__main__':
+    main()
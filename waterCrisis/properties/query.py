@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+Query application file.
+
+Query the processed property data CSV without scanning the whole file.
+
+A sidecar JSON index is kept next to the CSV. It holds the values of each
+area as columns sorted by date, the children of each parent area and the
+count-weighted province rollups for each date. The index is updated
+incrementally, by reading only the bytes which were added to the CSV since
+the last update. The CSV is sorted by date when written, so adding new days
+only appends rows. If the indexed part of the CSV has changed, such as when
+an older HTML file was added and reprocessed, then the index is rebuilt.
+
+Usage:
+    $ ./query.py series cape-town --start 2018-05-01 --end 2018-05-31
+    $ ./query.py latest western-cape
+    $ ./query.py rollup western-cape
+"""
+import argparse
+import bisect
+import csv
+import io
+import json
+import os
+
+import config
+from file_digest import hash_prefix
+
+
+INDEX_VERSION = 1
+
+
+def _area_key(parent, name):
+    return "{}|{}".format(parent, name)
+
+
+class PropertyIndex(object):
+    """Indexed access to the processed property data CSV.
+
+    Areas are identified by name, with an optional parent name to resolve
+    the area where a name appears under more than one parent.
+    """
+
+    def __init__(self, csv_path=config.DATA_CSV_PATH,
+                 index_path=config.DATA_INDEX_PATH):
+        self.csv_path = csv_path
+        self.index_path = index_path
+        self._reset()
+
+        if os.path.exists(index_path):
+            with open(index_path) as f_in:
+                index = json.load(f_in)
+            if index.get('version') == INDEX_VERSION:
+                self.size = index['size']
+                self.digest = index['digest']
+                self.areas = index['areas']
+                self.children = index['children']
+                self.rollups = index['rollups']
+                self.dates = index['dates']
+        self._build_names()
+
+    def _reset(self):
+        # Count of bytes of the CSV which have been indexed and their hash.
+        self.size = 0
+        self.digest = None
+        # Area key to dict of area type and columns of dates, average prices
+        # and property counts. Each column is sorted by date.
+        self.areas = {}
+        # Parent name to sorted list of area keys which are its children.
+        self.children = {}
+        # Date to dict of parent name to pair of sum of price multiplied by
+        # count and sum of count, over all suburbs of that parent.
+        self.rollups = {}
+        # Sorted list of unique dates.
+        self.dates = []
+
+    def _build_names(self):
+        # Name to list of area keys, to find an area by its name alone.
+        self.names = {}
+        for key in self.areas:
+            _, name = key.split("|", 1)
+            self.names.setdefault(name, []).append(key)
+
+    def _ingest_row(self, row):
+        date = row['Date']
+        parent = row['Parent']
+        price = int(row['Average Price'])
+        count = int(row['Property Count'])
+
+        key = _area_key(parent, row['Name'])
+        area = self.areas.get(key)
+        if area is None:
+            area = self.areas[key] = {
+                'area_type': row['Area Type'],
+                'dates': [],
+                'prices': [],
+                'counts': [],
+            }
+            bisect.insort(self.children.setdefault(parent, []), key)
+        area['dates'].append(date)
+        area['prices'].append(price)
+        area['counts'].append(count)
+
+        if not self.dates or self.dates[-1] != date:
+            self.dates.append(date)
+
+        if row['Area Type'] == 'suburb':
+            totals = self.rollups.setdefault(date, {}).setdefault(
+                parent, [0, 0]
+            )
+            totals[0] += price * count
+            totals[1] += count
+
+    def update(self):
+        """Bring the index up to date with the CSV and save it.
+
+        Only the bytes appended to the CSV since the last update are read,
+        unless the previously indexed bytes have changed, in which case the
+        whole CSV is indexed again.
+
+        @return: Count of rows added to the index.
+        """
+        csv_size = os.path.getsize(self.csv_path)
+        if (csv_size < self.size
+                or hash_prefix(self.csv_path, self.size) != self.digest):
+            self._reset()
+
+        with open(self.csv_path, 'rb') as f_in:
+            header = f_in.readline()
+            f_in.seek(max(self.size, len(header)))
+            new_bytes = f_in.read()
+
+        # Only index complete lines, in case the CSV is being written.
+        end = new_bytes.rfind(b"\n") + 1
+        new_text = (header + new_bytes[:end]).decode()
+
+        added = 0
+        for row in csv.DictReader(io.StringIO(new_text)):
+            self._ingest_row(row)
+            added += 1
+
+        self.size = max(self.size, len(header)) + end
+        self.digest = hash_prefix(self.csv_path, self.size)
+        self._build_names()
+        self.save()
+
+        return added
+
+    def save(self):
+        """Write the index out to its sidecar JSON file."""
+        index = {
+            'version': INDEX_VERSION,
+            'size': self.size,
+            'digest': self.digest,
+            'areas': self.areas,
+            'children': self.children,
+            'rollups': self.rollups,
+            'dates': self.dates,
+        }
+        tmp_path = "{}.tmp".format(self.index_path)
+        with open(tmp_path, 'w') as f_out:
+            json.dump(index, f_out)
+        os.replace(tmp_path, self.index_path)
+
+    def _find_area(self, name, parent=None):
+        if parent is not None:
+            key = _area_key(parent, name)
+            if key not in self.areas:
+                raise KeyError("Area not found: {}".format(key))
+            return self.areas[key]
+
+        keys = self.names.get(name, [])
+        if not keys:
+            raise KeyError("Area not found: {}".format(name))
+        if len(keys) > 1:
+            raise ValueError("Area name {} is ambiguous, specify a parent"
+                             " from: {}".format(name, keys))
+
+        return self.areas[keys[0]]
+
+    def get_series(self, name, start=None, end=None, parent=None):
+        """Return the values of an area between two dates.
+
+        @param name: Name of the area, such as 'cape-town'.
+        @param start: Optional first date to include, as a datetime.date
+            or 'YYYY-MM-DD' string.
+        @param end: Optional last date to include, in the same format.
+        @param parent: Optional parent name of the area.
+
+        @return: List of tuples as (date, avg_price, property_count), sorted
+            by date.
+        """
+        area = self._find_area(name, parent)
+        dates = area['dates']
+
+        lo = bisect.bisect_left(dates, str(start)) if start else 0
+        hi = bisect.bisect_right(dates, str(end)) if end else len(dates)
+
+        return list(zip(
+            dates[lo:hi], area['prices'][lo:hi], area['counts'][lo:hi]
+        ))
+
+    def latest(self, parent):
+        """Return the most recent values for each child area of a parent.
+
+        @param parent: Name of the parent area, such as 'western-cape' or
+            'south-africa' for the provinces.
+
+        @return: List of dict objects in the same format as rows of
+            the CSV, sorted by name.
+        """
+        rows = []
+        for key in self.children.get(parent, []):
+            area = self.areas[key]
+            rows.append({
+                'Date': area['dates'][-1],
+                'Area Type': area['area_type'],
+                'Parent': parent,
+                'Name': key.split("|", 1)[1],
+                'Average Price': area['prices'][-1],
+                'Property Count': area['counts'][-1]
+            })
+
+        return rows
+
+    def province_rollup(self, province, date=None):
+        """Return aggregate values across all suburbs of a province.
+
+        @param province: Name of the province, such as 'western-cape'.
+        @param date: Optional date as a datetime.date or 'YYYY-MM-DD' string.
+            Defaults to the latest indexed date.
+
+        @return: Tuple of (avg_price, property_count) as the count-weighted
+            average price and the total count of properties. Or None values
+            if there is no suburb data for the province on the date.
+        """
+        if date is None:
+            if not self.dates:
+                return None, None
+            date = self.dates[-1]
+
+        weighted_sum, count = self.rollups.get(str(date), {}).get(
+            province, (0, 0)
+        )
+        if not count:
+            return None, None
+
+        return weighted_sum / count, count
+
+
+def main():
+    """
+    Command-line function to update the index and run a query on it.
+    """
+    parser = argparse.ArgumentParser(description="Query utility. Update the"
+                                     " index of processed data and query it.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    series_parser = subparsers.add_parser(
+        'series',
+        help="Print values of an area over a date range."
+    )
+    series_parser.add_argument('name')
+    series_parser.add_argument('--parent')
+    series_parser.add_argument('--start', metavar="YYYY-MM-DD")
+    series_parser.add_argument('--end', metavar="YYYY-MM-DD")
+
+    latest_parser = subparsers.add_parser(
+        'latest',
+        help="Print latest values of the child areas of a parent area."
+    )
+    latest_parser.add_argument('parent')
+
+    rollup_parser = subparsers.add_parser(
+        'rollup',
+        help="Print aggregate values across the suburbs of a province."
+    )
+    rollup_parser.add_argument('province')
+    rollup_parser.add_argument('--date', metavar="YYYY-MM-DD")
+
+    args = parser.parse_args()
+
+    index = PropertyIndex()
+    added = index.update()
+    print("Indexed new rows: {:,d}".format(added))
+
+    if args.command == 'series':
+        series = index.get_series(args.name, args.start, args.end, args.parent)
+        for date, avg_price, property_count in series:
+            print("{} R{:>12,d} {:>8,d}".format(
+                date, avg_price, property_count
+            ))
+    elif args.command == 'latest':
+        for row in index.latest(args.parent):
+            print("{Date} {Name:30} R{Average Price:>12,d}"
+                  " {Property Count:>8,d}".format(**row))
+    else:
+        avg_price, property_count = index.province_rollup(
+            args.province, args.date
+        )
+        if avg_price is None:
+            print("No suburb data for: {}".format(args.province))
+        else:
+            print("Average price: R{:,.0f}".format(avg_price))
+            print("Property count: {:,d}".format(property_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+"""
+Replay server application file.
+
+Serve recorded property24 pages on a local HTTP server, so that the scrape
+and prepare metadata scripts can be run without a network connection.
+
+Pages are served from the sample directory and from a snapshot store, which
+is a directory of HTML files as written by scrape_html.py. Requests are
+matched to pages by the area names in the path and not by the area ID, so
+a page is found for a path such as:
+    /property-values/cape-town/western-cape/432
+from a recorded page for Cape Town in the Western Cape. If there is more than
+one recorded page for an area, the most recent is used. Any path with no
+recorded page gets a 404 error, unless a fallback page is set, such as the
+sample page for Cape Town to serve for every area in a load test.
+
+Latency, errors and timeouts can be injected. Whether a request gets an
+error or a timeout is decided by a random number generator which is seeded
+with the seed, path and count of requests for that path, so that a run with
+the same requests gets the same outcomes regardless of thread timing.
+
+Point the fetchers at the server using the host domain environment variable.
+A separate var directory must be set as well, so that the metadata and pages
+written by the run are kept apart from the real data:
+    $ ./replay_server.py --port 8035 --latency 0.05 --error-rate 0.05
+    $ export PROPERTY24_HOST_DOMAIN=http://127.0.0.1:8035
+    $ export PROPERTY24_VAR_DIR=/tmp/property24_replay
+    $ ./prepare_metadata.py
+    $ ./scrape_html.py
+
+Counts of requests, connections and injected faults are printed on shutdown
+and can be fetched while running from the "/__stats__" path.
+
+Pages are served over HTTP/1.1 by default. Use the HTTP/2 option to serve
+over cleartext HTTP/2 instead, for the http2 transport to connect to without
+negotiating. This needs the optional h2 package:
+    $ ./replay_server.py --http2 --latency 0.05
+    $ export PROPERTY24_TRANSPORT=http2
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import config
+from html_index import open_html, scan_html
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "sample")
+SOURCE_URI_PATTERN = re.compile(r"property24\.com(/property-values/[\w/-]+)")
+
+
+def get_area_key(path):
+    """Return a key for the area of a page path, ignoring any area ID.
+
+    @param path: Path such as "/property-values/western-cape/9" or
+        "/property-values/cape-town/western-cape/432".
+
+    @return: Tuple of area names, as (name,) for provinces or
+        (name, parent_name) for suburbs. Or None if not a property values
+        path.
+    """
+    elements = [e for e in path.split("?")[0].split("/") if e]
+    if not elements or elements[0] != "property-values":
+        return None
+
+    names = tuple(e for e in elements[1:] if not e.isdigit())
+
+    return names or None
+
+
+def load_pages(snapshot_dir=None):
+    """Return dict of area keys to paths of recorded pages.
+
+    Sample pages are keyed using the source URI in their comment. Pages in
+    the snapshot store are keyed using their filenames and replace sample
+    pages for the same area.
+
+    @param snapshot_dir: Optional directory of HTML files as written by
+        scrape_html.py.
+    """
+    pages = {}
+
+    for filename in sorted(os.listdir(SAMPLE_DIR)):
+        f_path = os.path.join(SAMPLE_DIR, filename)
+        with open(f_path) as f_in:
+            match = SOURCE_URI_PATTERN.search(f_in.read())
+        if match:
+            pages[get_area_key(match.group(1))] = f_path
+
+    if snapshot_dir:
+        # Sorted by filename, so later dates replace earlier ones.
+        for html_file in scan_html(snapshot_dir):
+            if html_file.area_type == 'province':
+                key = (html_file.name,)
+            else:
+                key = (html_file.name, html_file.parent_name)
+            pages[key] = html_file.path
+
+    return pages
+
+
+class Replay(object):
+    """Recorded pages with configurable fault injection."""
+
+    def __init__(self, pages, fallback_path=None, latency=0.0,
+                 jitter=0.0, error_rate=0.0, timeout_rate=0.0,
+                 timeout_delay=None, seed=0):
+        """
+        @param pages: Dict of area keys to paths, as from `load_pages`.
+        @param fallback_path: Optional path of a page to serve for any area
+            without a recorded page.
+        @param latency: Seconds to wait before responding to each request.
+        @param jitter: Maximum seconds to randomly add to the latency.
+        @param error_rate: Fraction of requests to respond to with a 503.
+        @param timeout_rate: Fraction of requests to delay beyond the
+            client's configured timeout.
+        @param timeout_delay: Seconds to delay those requests. Defaults to
+            one second more than the configured request timeout.
+        @param seed: Seed for deciding the outcome of each request.
+        """
+        self.pages = pages
+        self.fallback_path = fallback_path
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = (timeout_delay if timeout_delay is not None
+                              else config.REQUEST_TIMEOUT + 1)
+        self.seed = seed
+
+        self.stats = collections.Counter()
+        self.path_counts = collections.Counter()
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def get_random(self, path):
+        """Return a random number generator for the next request of a path."""
+        with self.lock:
+            self.path_counts[path] += 1
+            count = self.path_counts[path]
+
+        return random.Random("{}:{}:{}".format(self.seed, path, count))
+
+    def record(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def get_stats(self):
+        """Return dict of counts and the request rate since starting."""
+        with self.lock:
+            stats = dict(self.stats)
+        duration = time.time() - self.started
+        stats['duration'] = duration
+        stats['requests_per_second'] = (
+            stats.get('requests', 0) / duration if duration else 0
+        )
+
+        if stats.get('connections'):
+            stats['requests_per_connection'] = (
+                stats.get('requests', 0) / stats['connections']
+            )
+
+        return stats
+
+    def respond(self, path):
+        """Wait for any latency then return the response for a path.
+
+        @return: Tuple of (status, body, content type), where the body is
+            None for an error.
+        """
+        if path == "/__stats__":
+            return 200, json.dumps(self.get_stats()).encode(), \
+                "application/json"
+
+        self.record('requests')
+        rand = self.get_random(path)
+        time.sleep(self.latency + rand.uniform(0, self.jitter))
+
+        outcome = rand.random()
+        if outcome < self.error_rate:
+            self.record('injected_errors')
+            return 503, None, None
+        if outcome < self.error_rate + self.timeout_rate:
+            self.record('injected_timeouts')
+            time.sleep(self.timeout_delay)
+
+        key = get_area_key(path)
+        f_path = self.pages.get(key, self.fallback_path) if key else None
+        if f_path is None:
+            self.record('not_found')
+            return 404, None, None
+
+        f_in, _ = open_html(f_path)
+        with f_in:
+            body = f_in.read()
+        self.record('bytes', len(body))
+
+        return 200, body, "text/html; charset=utf-8"
+
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    """HTTP/1.1 server of recorded pages."""
+
+    daemon_threads = True
+
+    def __init__(self, address, replay):
+        """
+        @param address: Tuple of (host, port) to bind to.
+        @param replay: Replay object to respond with.
+        """
+        super().__init__(address, ReplayHandler)
+        self.replay = replay
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+
+    # Keep connections open between requests, as the site does. Send the
+    # headers and body without waiting on the client's delayed ACK.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.replay.record('connections')
+
+    def do_GET(self):
+        status, body, content_type = self.server.replay.respond(self.path)
+        if body is None:
+            self.send_error(status)
+        else:
+            self.send_body(status, body, content_type)
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, such as on an injected timeout.
+            pass
+
+    def log_message(self, format, *args):
+        # Keep the output for the stats only.
+        pass
+
+
+class Http2ReplayProtocol(asyncio.Protocol):
+    """Cleartext HTTP/2 connection, serving each stream from a replay.
+
+    Responses are made in a thread pool, since the replay waits for latency
+    and injected timeouts by sleeping.
+    """
+
+    def __init__(self, replay, executor):
+        self.replay = replay
+        self.executor = executor
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False,
+                                             header_encoding='utf-8')
+        )
+        self.transport = None
+        # Futures of streams waiting for the flow control window to open.
+        self.window_waiters = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.replay.record('connections')
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc):
+        for waiter in self.window_waiters.values():
+            if not waiter.done():
+                waiter.cancel()
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                path = dict(event.headers)[':path']
+                asyncio.ensure_future(self.respond(event.stream_id, path))
+            elif isinstance(event, (h2.events.WindowUpdated,
+                                    h2.events.StreamReset)):
+                # A window update for stream 0 applies to all streams.
+                for stream_id, waiter in list(self.window_waiters.items()):
+                    if event.stream_id in (0, stream_id) \
+                            and not waiter.done():
+                        waiter.set_result(None)
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id, path):
+        loop = asyncio.get_event_loop()
+        status, body, content_type = await loop.run_in_executor(
+            self.executor, self.replay.respond, path
+        )
+        if body is None:
+            body = "{} error\n".format(status).encode()
+            content_type = "text/plain"
+
+        try:
+            self.conn.send_headers(stream_id, [
+                (':status', str(status)),
+                ('content-type', content_type),
+                ('content-length', str(len(body))),
+            ])
+            while body:
+                window = self.conn.local_flow_control_window(stream_id)
+                if window <= 0:
+                    waiter = loop.create_future()
+                    self.window_waiters[stream_id] = waiter
+                    await waiter
+                    del self.window_waiters[stream_id]
+                    continue
+                size = min(window, len(body),
+                           self.conn.max_outbound_frame_size)
+                self.conn.send_data(stream_id, body[:size])
+                body = body[size:]
+                self.transport.write(self.conn.data_to_send())
+            self.conn.end_stream(stream_id)
+            self.transport.write(self.conn.data_to_send())
+        except (h2.exceptions.StreamClosedError,
+                h2.exceptions.ProtocolError, asyncio.CancelledError):
+            # The client gave up waiting, such as on an injected timeout.
+            pass
+
+
+class Http2ReplayServer(object):
+    """Cleartext HTTP/2 server of recorded pages.
+
+    Has the serve_forever, shutdown and server_close methods of the HTTP/1.1
+    server, so that it can be run the same way.
+    """
+
+    def __init__(self, address, replay, max_workers=64):
+        """
+        @param address: Tuple of (host, port) to bind to.
+        @param replay: Replay object to respond with.
+        @param max_workers: Maximum number of responses to make at once.
+
+        @throws: ImportError if h2 is not installed.
+        """
+        if h2 is None:
+            raise ImportError("Serving HTTP/2 needs h2. Install with:"
+                              " pip install h2")
+        self.replay = replay
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self.protocols = []
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.loop.create_server(
+            self._make_protocol, *address
+        ))
+        self.server_address = self.server.sockets[0].getsockname()[:2]
+
+    def _make_protocol(self):
+        protocol = Http2ReplayProtocol(self.replay, self.executor)
+        self.protocols.append(protocol)
+        return protocol
+
+    def serve_forever(self):
+        self.loop.run_forever()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def server_close(self):
+        self.server.close()
+        for protocol in self.protocols:
+            if protocol.transport is not None:
+                protocol.transport.close()
+        # Cancel responses still waiting, such as on injected timeouts.
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True)
+            )
+        self.loop.close()
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    """
+    Command-line function to serve recorded pages until interrupted.
+    """
+    parser = argparse.ArgumentParser(description="Replay server utility."
+                                     " Serve recorded property24 pages"
+                                     " locally, with injected faults.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('-p', '--port', type=int, default=8035)
+    parser.add_argument(
+        '-s', '--snapshots',
+        metavar="DIR_PATH",
+        help="Directory of HTML files to serve, as written by scrape_html.py."
+            " For example: {}".format(config.HTML_OUT_DIR)
+    )
+    parser.add_argument(
+        '-f', '--fallback',
+        metavar="HTML_PATH",
+        help="Optionally choose a page to serve for areas without a"
+            " recorded page, instead of a 404. For example: {}".format(
+                os.path.join(SAMPLE_DIR, "city.html")
+            )
+    )
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds to wait before each response.")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Maximum random seconds added to the latency.")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests to fail with a 503.")
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help="Fraction of requests to delay past the"
+                        " request timeout.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--http2', action='store_true',
+                        help="Serve over cleartext HTTP/2 instead of"
+                        " HTTP/1.1.")
+    args = parser.parse_args()
+
+    pages = load_pages(args.snapshots)
+    replay = Replay(
+        pages,
+        fallback_path=args.fallback or None,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed
+    )
+    if args.http2:
+        server = Http2ReplayServer((args.host, args.port), replay)
+    else:
+        server = ReplayServer((args.host, args.port), replay)
+    print("Loaded recorded pages: {:,d}".format(len(pages)))
+    print("Serving {} on: http://{}:{}".format(
+        "HTTP/2" if args.http2 else "HTTP/1.1",
+        *server.server_address
+    ))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print()
+        for key, value in sorted(replay.get_stats().items()):
+            print("{}: {:,.2f}".format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Retention application file.
+
+Limit the disk used by the stored HTML directory, by thinning out older
+pages and compacting each past month into a zip archive which the process
+scripts read from directly, as described in the html_index module. Pages
+written by scrape_html.py and by the curl script in the tools directory are
+handled alike.
+
+The policy, as set in the config, is:
+
+    - Keep every page from the most recent days.
+    - Before that, keep the first page of each week for each area.
+    - Always keep pages recorded in the quarantine CSV, since they failed
+      parsing and may be needed to fix the parser.
+    - Always keep pages dated after the last date in the processed CSV, so
+      that no page is removed before its row is written.
+    - Compact each month before the current month into an archive of the
+      pages it keeps, replacing its directory.
+    - If the directory is still over the disk budget, thin the oldest
+      archived months to the first page of the month for each area, one
+      month at a time, until under the budget.
+
+Each page removed is recorded in the removed pages CSV, with the directory
+it was removed from. Processing that directory again keeps the rows of the
+removed pages which are already in the processed CSV, as described in
+`process_html.read_removed_rows`. Rows of any other page without an HTML
+file, such as one deleted by hand, are dropped.
+
+Usage:
+    $ ./retention.py --dry-run
+    $ ./retention.py
+"""
+import argparse
+import collections
+import csv
+import datetime
+import os
+import shutil
+import zipfile
+
+import config
+from html_index import (INDEX_DIR_NAME, get_archive_name, migrate,
+                        open_html, scan_html, split_archive_path)
+from quarantine import read_quarantined
+
+
+REMOVED_FIELDNAMES = ['Removed', 'Directory', 'Date', 'Area Type', 'Parent',
+                      'Name', 'Filename']
+
+
+def record_removed(html_dir, html_files, csv_path=config.REMOVED_CSV_PATH):
+    """Append removed pages to the removed pages CSV.
+
+    @param html_dir: Path of the HTML directory the pages were removed from.
+    @param html_files: List of HtmlFile objects of the removed pages.
+    """
+    is_new = not os.path.exists(csv_path)
+    removed = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(csv_path, 'a') as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=REMOVED_FIELDNAMES)
+        if is_new:
+            writer.writeheader()
+        for html_file in html_files:
+            writer.writerow({
+                'Removed': removed,
+                'Directory': os.path.abspath(html_dir),
+                'Date': html_file.date,
+                'Area Type': html_file.area_type,
+                'Parent': html_file.parent_name,
+                'Name': html_file.name,
+                'Filename': html_file.filename
+            })
+
+
+def read_removed(html_dir, csv_path=config.REMOVED_CSV_PATH):
+    """Return pages removed from an HTML directory by the retention script.
+
+    @param html_dir: Path of the HTML directory.
+
+    @return: Set of tuples as (date, area_type, parent_name, name).
+    """
+    if not os.path.exists(csv_path):
+        return set()
+
+    html_dir = os.path.abspath(html_dir)
+    with open(csv_path) as f_in:
+        return {
+            (row['Date'], row['Area Type'], row['Parent'], row['Name'])
+            for row in csv.DictReader(f_in)
+            if row['Directory'] == html_dir
+        }
+
+
+def get_dir_size(html_dir):
+    """Return total size in bytes of files in a directory, recursively."""
+    total = 0
+    with os.scandir(html_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                total += get_dir_size(entry.path)
+            else:
+                total += entry.stat().st_size
+
+    return total
+
+
+def get_last_processed_date(csv_path=config.DATA_CSV_PATH):
+    """Return the last date in the processed CSV, or "" if there is none.
+
+    The CSV is sorted by date, so only the end of the file is read.
+    """
+    if not os.path.exists(csv_path):
+        return ""
+
+    with open(csv_path, 'rb') as f_in:
+        size = f_in.seek(0, os.SEEK_END)
+        f_in.seek(max(size - 4096, 0))
+        lines = f_in.read().decode(errors='ignore').split("\n")
+    last_line = next((line for line in reversed(lines) if line.strip()), "")
+    date = last_line.split(",", 1)[0]
+
+    return "" if date == "Date" else date
+
+
+def _get_area_key(html_file):
+    return html_file.area_type, html_file.parent_name, html_file.name
+
+
+def _keep_first(html_files, get_period, keep):
+    """Add to keep the filename of the first file of each area and period."""
+    first_files = {}
+    for html_file in html_files:
+        key = (_get_area_key(html_file), get_period(html_file))
+        first = first_files.get(key)
+        if first is None or html_file.date < first.date:
+            first_files[key] = html_file
+    keep.update(html_file.filename for html_file in first_files.values())
+
+
+def select_kept(html_files, today, protected,
+                daily_days=config.RETENTION_DAILY_DAYS,
+                weekly=config.RETENTION_WEEKLY):
+    """Return filenames of the files to keep by the daily and weekly policy.
+
+    @param html_files: List of HtmlFile objects of all stored pages.
+    @param today: datetime.date object to count recent days back from.
+    @param protected: Set of filenames to always keep.
+    @param daily_days: Number of recent days to keep every page for.
+    @param weekly: If True, keep the first page of each week for each area
+        before that. Otherwise keep every page.
+
+    @return: Set of filenames.
+    """
+    daily_start = str(today - datetime.timedelta(days=daily_days))
+    keep = set(protected)
+
+    older_files = []
+    for html_file in html_files:
+        if html_file.date > daily_start or not weekly:
+            keep.add(html_file.filename)
+        else:
+            older_files.append(html_file)
+
+    def get_week(html_file):
+        date = datetime.date.fromisoformat(html_file.date)
+        return date.isocalendar()[:2]
+
+    _keep_first(older_files, get_week, keep)
+
+    return keep
+
+
+def write_archive(archive_path, html_files, archives):
+    """Write files to a new archive, replacing any existing archive.
+
+    @param archive_path: Path of the archive to write.
+    @param html_files: HtmlFile objects of the files to add, which may be in
+        the existing archive.
+    @param archives: Dict of open ZipFile objects, as for `open_html`.
+
+    @return: None
+    """
+    tmp_path = "{}.tmp".format(archive_path)
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED,
+                         compresslevel=9) as out_zip:
+        for html_file in sorted(html_files, key=lambda f: f.filename):
+            f_in, _ = open_html(html_file.path, archives)
+            with f_in, out_zip.open(html_file.filename, 'w') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+
+    zip_file = archives.pop(archive_path, None)
+    if zip_file is not None:
+        zip_file.close()
+    os.replace(tmp_path, archive_path)
+
+
+class Retention(object):
+    """Apply the retention policy to an HTML directory."""
+
+    def __init__(self, html_dir=config.HTML_OUT_DIR, today=None,
+                 dry_run=False, csv_path=config.DATA_CSV_PATH,
+                 removed_csv_path=config.REMOVED_CSV_PATH):
+        """
+        @param html_dir: Path to the directory of HTML files.
+        @param today: Optional datetime.date object. Defaults to today.
+        @param dry_run: If True, only report what would be done.
+        @param csv_path: Path of the processed CSV. Pages dated after its
+            last date are kept.
+        @param removed_csv_path: Path of the CSV to record removed pages in.
+        """
+        self.html_dir = html_dir
+        self.today = today or datetime.date.today()
+        self.dry_run = dry_run
+        self.removed_csv_path = removed_csv_path
+        self.processed_until = get_last_processed_date(csv_path)
+        self.archives = {}
+
+        self.removed_count = 0
+        self.compacted_months = []
+        self.thinned_months = []
+
+    def _get_months(self):
+        """Return dict of month names to HtmlFile objects of each month."""
+        months = collections.defaultdict(list)
+        for html_file in scan_html(self.html_dir):
+            months[html_file.date[:7]].append(html_file)
+
+        return dict(sorted(months.items()))
+
+    def _keep_unprocessed(self, html_files, keep):
+        """Add to keep the filenames of files not processed yet."""
+        keep.update(html_file.filename for html_file in html_files
+                    if html_file.date > self.processed_until)
+
+    def _apply_month(self, month, html_files, keep, compact):
+        """Remove files of a month which are not kept and optionally compact.
+
+        @return: True if the month was changed.
+        """
+        kept_files = [f for f in html_files if f.filename in keep]
+        removed_files = [f for f in html_files if f.filename not in keep]
+        loose_files = [f for f in html_files
+                       if split_archive_path(f.path) is None]
+        if not removed_files and not (compact and loose_files):
+            return False
+
+        self.removed_count += len(removed_files)
+        if self.dry_run:
+            return True
+        # Record the pages before removing them, so that an interrupted run
+        # never leaves a page removed but not recorded.
+        if removed_files:
+            record_removed(self.html_dir, removed_files,
+                           self.removed_csv_path)
+
+        archive_path = os.path.join(self.html_dir, get_archive_name(month))
+        if compact or os.path.exists(archive_path):
+            archived_files = kept_files if compact else [
+                f for f in kept_files if split_archive_path(f.path)
+            ]
+            if archived_files:
+                write_archive(archive_path, archived_files, self.archives)
+            elif os.path.exists(archive_path):
+                os.remove(archive_path)
+
+        for html_file in loose_files:
+            if compact or html_file.filename not in keep:
+                os.remove(html_file.path)
+
+        partition_dir = os.path.join(self.html_dir, month)
+        if os.path.isdir(partition_dir) and not os.listdir(partition_dir):
+            os.rmdir(partition_dir)
+            index_path = os.path.join(self.html_dir, INDEX_DIR_NAME,
+                                      "{}.json".format(month))
+            if os.path.exists(index_path):
+                os.remove(index_path)
+
+        return True
+
+    def apply_policy(self, protected):
+        """Apply the daily and weekly policy and compact past months.
+
+        @param protected: Set of filenames to always keep.
+        """
+        months = self._get_months()
+        all_files = [f for files in months.values() for f in files]
+        keep = select_kept(all_files, self.today, protected)
+        self._keep_unprocessed(all_files, keep)
+        current_month = str(self.today)[:7]
+
+        for month, html_files in months.items():
+            compact = month < current_month
+            if self._apply_month(month, html_files, keep, compact) \
+                    and compact:
+                self.compacted_months.append(month)
+
+    def apply_budget(self, protected, budget=config.RETENTION_DISK_BUDGET):
+        """Thin the oldest past months until the directory is within budget.
+
+        @param protected: Set of filenames to always keep.
+        @param budget: Maximum size of the directory in bytes.
+
+        @return: True if the directory is within budget.
+        """
+        current_month = str(self.today)[:7]
+        for month, html_files in self._get_months().items():
+            if get_dir_size(self.html_dir) <= budget:
+                return True
+            if month >= current_month:
+                break
+
+            keep = set(protected)
+            _keep_first(html_files, lambda f: f.date[:7], keep)
+            self._keep_unprocessed(html_files, keep)
+            if self._apply_month(month, html_files, keep, True):
+                self.thinned_months.append(month)
+
+        return get_dir_size(self.html_dir) <= budget
+
+    def close(self):
+        for zip_file in self.archives.values():
+            zip_file.close()
+        self.archives = {}
+
+
+def main():
+    """
+    Command-line function to apply the retention policy.
+    """
+    parser = argparse.ArgumentParser(description="Retention utility. Thin"
+                                     " out and compact stored HTML files to"
+                                     " keep within a disk budget.")
+    parser.add_argument(
+        '-r', '--read',
+        metavar="DIR_PATH",
+        default=config.HTML_OUT_DIR,
+        help="Optionally choose a directory of HTML files. Defaults to: {}"
+            .format(config.HTML_OUT_DIR)
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help="Only report the pages which would be removed and the months"
+            " which would be compacted. The disk budget is not checked."
+    )
+    args = parser.parse_args()
+
+    size_before = get_dir_size(args.read)
+    if not args.dry_run:
+        print("Moved top level files into partitions: {:,d}".format(
+            migrate(args.read)
+        ))
+    protected = set(read_quarantined())
+    print("Quarantined pages kept: {:,d}".format(len(protected)))
+
+    retention = Retention(args.read, dry_run=args.dry_run)
+    print("Processed up to: {}".format(retention.processed_until or "-"))
+    try:
+        retention.apply_policy(protected)
+        within_budget = True
+        if config.RETENTION_DISK_BUDGET is not None and not args.dry_run:
+            within_budget = retention.apply_budget(protected)
+    finally:
+        retention.close()
+
+    prefix = "Would remove" if args.dry_run else "Removed"
+    print("{} pages: {:,d}".format(prefix, retention.removed_count))
+    print("Compacted months: {}".format(
+        ", ".join(retention.compacted_months) or "-"
+    ))
+    print("Thinned months to monthly: {}".format(
+        ", ".join(retention.thinned_months) or "-"
+    ))
+    print("Size before: {:,d} bytes".format(size_before))
+    if not args.dry_run:
+        print("Size after: {:,d} bytes".format(get_dir_size(args.read)))
+    if not within_budget:
+        print("Warning: still over the disk budget of {:,d} bytes, with all"
+              " past months thinned".format(config.RETENTION_DISK_BUDGET))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,8 @@ Read a configured CSV file of suburbs and province metadata which have been
 scraped from the property24.com website, but exit if it does not exist yet
 (this check is handled within the config script). For each row in the CSV,
 fetch HTML for the given URI then write out a text file with an appropriate
-name. No processing of the HTML is done in this script.
+name, in the directory for the current month. No processing of the HTML is
+done in this script.
 
 TODO: Print aggregate counts rather than individual line, especially when
 doing the whole country.
@@ -14,110 +15,189 @@ TODO: A configuration for which provinces to get e.g. only western cape. Or
 to switch between all data and province only data, since the detail is not
 necessary perhaps in all provinces.
 """
+import contextlib
 import csv
 import datetime
-import requests
 import os
+import sys
 import time
+import urllib.parse
 
 import config
+from html_index import get_partition_dir
+from ledger import RunLedger
+from transport import get_transport
 
 
-def main():
+def read_metadata():
+    """
+    Read the configured metadata CSV and return its rows.
+
+    @return: List of dict objects, one for each area row in the CSV.
+    """
+    with open(config.METADATA_CSV_PATH) as f_in:
+        return list(csv.DictReader(f_in))
+
+
+def get_uri(row):
+    """
+    Return the URI of a metadata row, on the configured host domain.
+
+    The metadata CSV stores full URIs, so the path is moved to the configured
+    host in case that has changed since the metadata was prepared.
+    """
+    parts = urllib.parse.urlsplit(row['uri'])
+    path = urllib.parse.urlunsplit(('', '', parts.path, parts.query, ''))
+
+    return "".join((config.HOST_DOMAIN, path))
+
+
+def main(session=None, metadata_rows=None, transport=None):
     """
     Fetch and write out HTML files around property values.
 
-    Use requests.Session to keep a connection open to the domain and get a
+    URIs are handed to the configured transport in batches, as described in
+    the transport module. The default session transport uses
+    requests.Session to keep a connection open to the domain and get a
     performance benefit, as per the documentation here:
         http://docs.python-requests.org/en/master/user/advanced/
 
     In case there is a poor connection or the server is slow to response,
-    catch all request errors for a URI up to a configured number of attempts,
-    waiting between attempts and finally raising the error if all attempts
-    failed. This was implemented because ReadTimeout errors were causing
-    the script to abort.
+    the transport catches all request errors for a URI up to a configured
+    number of attempts, waiting between attempts. If all attempts failed,
+    the error is raised here. This was implemented because ReadTimeout
+    errors were causing the script to abort.
 
     Once request is complete, handle anything other than a HTTP
     success as an error, then skip to the next URI.
 
+    Each URI is recorded in a run ledger, with its latency, size, status and
+    count of retries, and metrics of the run are written when it ends.
+
+    @param session: Optional requests.Session to reuse, such that a long
+        running process can keep its connections to the domain open across
+        calls. A new session is created if this is omitted.
+    @param metadata_rows: Optional list of metadata rows already read in
+        with `read_metadata`. The metadata CSV is read if this is omitted.
+    @param transport: Optional transport to reuse, from
+        `transport.get_transport`, such that a long running process can keep
+        its connection open across calls. The configured transport is
+        created and closed at the end if this is omitted.
+
     @return: None
     @throws: AssertionError
     """
     today = datetime.date.today()
-    session = requests.Session()
+    if metadata_rows is None:
+        metadata_rows = read_metadata()
+    own_transport = transport is None
+    if own_transport:
+        transport = get_transport(session=session)
+    else:
+        transport.reset_stats()
+    out_dir = get_partition_dir(config.HTML_OUT_DIR, today)
     processed = skipped = errors = 0
-
-    with open(config.METADATA_CSV_PATH) as f_in:
-        reader = csv.DictReader(f_in)
-
-        try:
-            for row in reader:
-                out_name = "{area_type}|{parent_name}|{name}|{area_id}|{date}"\
-                    ".html".format(
-                        area_type=row['area_type'],
-                        parent_name=row['parent_name'],
+    start = time.time()
+    ledger = RunLedger('scrape_html')
+
+    try:
+        pending = []
+        for row in metadata_rows:
+            out_name = "{area_type}|{parent_name}|{name}|{area_id}|{date}"\
+                ".html".format(
+                    area_type=row['area_type'],
+                    parent_name=row['parent_name'],
+                    name=row['name'],
+                    area_id=row['area_id'],
+                    date=str(today)
+                )
+            out_path = os.path.join(out_dir, out_name)
+            uri = get_uri(row)
+            area = "{}|{}".format(row['parent_name'], row['name'])
+
+            # For suburbs, only fetch those which match configured
+            # provinces.
+            if (row['area_type'] == 'suburb' and row['parent_name']
+                    not in config.SUBURB_DETAIL_REQUIRED):
+                continue
+
+            if config.SKIP_EXISTING and os.path.exists(out_path):
+                if config.SHOW_SKIPPED:
+                    print("Skipping: {parent} | {name}".format(
                         name=row['name'],
-                        area_id=row['area_id'],
-                        date=str(today)
-                    )
-                out_path = os.path.join(config.HTML_OUT_DIR, out_name)
-
-                # For suburbs, only fetch those which match configured
-                # provinces.
-                if (row['area_type'] == 'suburb' and row['parent_name']
-                        not in config.SUBURB_DETAIL_REQUIRED):
-                    continue
-
-                if config.SKIP_EXISTING and os.path.exists(out_path):
-                    if config.SHOW_SKIPPED:
-                        print("Skipping: {parent} | {name}".format(
-                            name=row['name'],
-                            parent=row['parent_name']
-                        ))
-                    skipped += 1
-                else:
+                        parent=row['parent_name']
+                    ))
+                skipped += 1
+                ledger.record('skipped', uri=uri, area=area)
+            else:
+                pending.append((row, out_path, uri, area))
+
+        for i in range(0, len(pending), config.FETCH_BATCH_SIZE):
+            batch = {uri: (row, out_path, area)
+                     for row, out_path, uri, area
+                     in pending[i:i+config.FETCH_BATCH_SIZE]}
+
+            # Each page is written as soon as it is fetched, so that a
+            # request error part way through a batch loses no pages.
+            with contextlib.closing(
+                    transport.fetch_many(list(batch))) as results:
+                for result in results:
+                    uri = result.uri
+                    row, out_path, area = batch[uri]
                     print("Processing: {parent} | {name} ... ".format(
                         name=row['name'],
                         parent=row['parent_name']
                     ))
+                    entry = dict(
+                        uri=uri,
+                        area=area,
+                        duration=result.duration,
+                        retries=result.retries
+                    )
 
-                    for attempt in range(config.REQUEST_ATTEMPTS):
-                        try:
-                            resp = session.get(
-                                row['uri'],
-                                timeout=config.REQUEST_TIMEOUT,
-                                headers=config.REQUEST_HEADERS
-                            )
-                            break
-                        except requests.RequestException as e:
-                            print("Failed attempt #{}".format(attempt+1))
-                            if attempt + 1 == config.REQUEST_ATTEMPTS:
-                                raise
-                            else:
-                                wait = config.REQUEST_ATTEMPT_WAIT
-                                print("  sleeping {}s".format(wait))
-                                time.sleep(wait)
-
-                    if resp.status_code == 200:
+                    if result.error:
+                        ledger.record('request_error',
+                                      reason=repr(result.error), **entry)
+                        raise result.error
+
+                    entry.update(
+                        http_status=result.status_code,
+                        http_version=result.http_version,
+                        bytes=len(result.content)
+                    )
+                    if result.status_code == 200:
                         with open(out_path, 'w') as f_out:
-                            f_out.writelines(resp.text)
-                        # Wait between requests, to avoid being possibly
-                        # blocked by the server for doing requests too
-                        # frequently.
-                        time.sleep(config.REQUEST_SPACING)
+                            f_out.writelines(result.text)
                         processed += 1
+                        ledger.record('ok', **entry)
                     else:
                         error = dict(
-                            code=resp.status_code,
-                            reason=resp.reason,
-                            uri=row['uri']
+                            code=result.status_code,
+                            reason=result.reason,
+                            uri=uri
                         )
                         print("Error: {code} {reason} {uri}".format(**error))
                         errors += 1
-        finally:
-            print("\nProcessed: {}".format(processed))
-            print("Skipped: {}".format(skipped))
-            print("Errors: {}".format(errors))
+                        ledger.record('http_error', reason=result.reason,
+                                      **entry)
+    finally:
+        ledger.close(failed=sys.exc_info()[0] is not None)
+        stats = transport.get_stats()
+        if own_transport:
+            transport.close()
+        duration = time.time() - start
+        print("\nProcessed: {}".format(processed))
+        print("Skipped: {}".format(skipped))
+        print("Errors: {}".format(errors))
+        print("Duration: {:,.1f}s".format(duration))
+        if duration:
+            print("Rate: {:,.2f} requests/s".format(
+                (processed + errors) / duration
+            ))
+        print("Transport: {transport}, requests: {requests:,d}, new"
+              " connections: {connections:,d}, HTTP versions:"
+              " {http_versions}".format(**stats))
+        print("Ledger: {}".format(ledger.path))
 
 
 if __name__ == '__main__':
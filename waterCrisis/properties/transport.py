@@ -0,0 +1,290 @@
+"""
+Transport for fetching pages.
+
+The scrape script hands URIs to a transport in batches and gets back a
+result for each as soon as it is fetched. Two transports are available:
+
+    session: Fetch one URI at a time on a requests.Session, which keeps its
+        HTTP/1.1 connection to the host open between requests. Requests are
+        spaced out by the configured request spacing.
+    http2: Fetch URIs as streams over a single HTTP/2 connection, using
+        httpx. On the live site, one request is in flight at a time and
+        requests are spaced out as for the session transport. On another
+        host, such as a local replay server, many requests are in flight at
+        a time, up to the configured maximum streams. For an https host,
+        HTTP/2 is negotiated with the server and HTTP/1.1 is used if the
+        server does not support it. For an http host, HTTP/2 is used
+        directly without negotiating.
+
+The http2 transport needs the optional httpx and h2 packages:
+    $ pip install httpx[http2]
+If they are not installed, the session transport is used instead.
+
+Both transports retry a failed request up to the configured number of
+attempts and keep counts of requests, new connections and HTTP versions,
+so that connection reuse can be compared. A transport can be kept open
+across runs by the caller, such as the daemon, to reuse its connection.
+"""
+import asyncio
+import collections
+import time
+import urllib.parse
+
+import requests
+
+import config
+
+try:
+    import h2
+    import httpx
+except ImportError:
+    h2 = httpx = None
+
+
+TRANSPORT_NAMES = ('session', 'http2')
+
+FetchResult = collections.namedtuple(
+    'FetchResult',
+    ['uri', 'status_code', 'reason', 'text', 'content', 'duration',
+     'retries', 'http_version', 'error']
+)
+FetchResult.__doc__ = """Outcome of fetching a URI.
+
+On a request error after the last attempt, the error is set and the
+response values are None.
+"""
+
+
+class SessionTransport(object):
+    """Fetch one URI at a time on a requests.Session."""
+
+    name = 'session'
+
+    def __init__(self, session=None):
+        """
+        @param session: Optional requests.Session to reuse. A new session is
+            created if this is omitted.
+        """
+        self.session = session if session is not None else requests.Session()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start counting requests and new connections from now."""
+        self.requests = 0
+        self.http_versions = collections.Counter()
+        # The session may have connections from before, so only count new
+        # connections since now.
+        self._start_connections = self._count_connections()
+
+    def _count_connections(self):
+        """Return count of connections opened by the session's pools."""
+        count = 0
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                count += pools[key].num_connections
+
+        return count
+
+    def _fetch(self, uri):
+        for attempt in range(config.REQUEST_ATTEMPTS):
+            request_start = time.time()
+            try:
+                resp = self.session.get(
+                    uri,
+                    timeout=config.REQUEST_TIMEOUT,
+                    headers=config.REQUEST_HEADERS
+                )
+                break
+            except requests.RequestException as e:
+                print("Failed attempt #{}".format(attempt+1))
+                if attempt + 1 == config.REQUEST_ATTEMPTS:
+                    return FetchResult(uri, None, None, None, None,
+                                       time.time() - request_start, attempt,
+                                       None, e)
+                wait = config.REQUEST_ATTEMPT_WAIT
+                print("  sleeping {}s".format(wait))
+                time.sleep(wait)
+        duration = time.time() - request_start
+
+        self.requests += 1
+        http_version = "HTTP/{:.1f}".format(resp.raw.version / 10)
+        self.http_versions[http_version] += 1
+        if resp.status_code == 200:
+            # Wait between requests, to avoid being possibly blocked by the
+            # server for doing requests too frequently.
+            time.sleep(config.REQUEST_SPACING)
+
+        return FetchResult(uri, resp.status_code, resp.reason, resp.text,
+                           resp.content, duration, attempt, http_version,
+                           None)
+
+    def fetch_many(self, uris):
+        """Fetch URIs in order, stopping after any request error.
+
+        @return: Generator of FetchResult objects, each yielded as soon as
+            it is fetched, in the order of the URIs.
+        """
+        for uri in uris:
+            result = self._fetch(uri)
+            yield result
+            if result.error:
+                break
+
+    def get_stats(self):
+        """Return dict of counts of requests and connections."""
+        return {
+            'transport': self.name,
+            'requests': self.requests,
+            'connections': self._count_connections()
+                - self._start_connections,
+            'http_versions': dict(self.http_versions),
+        }
+
+    def close(self):
+        pass
+
+
+class Http2Transport(object):
+    """Fetch many URIs at a time over a single HTTP/2 connection."""
+
+    name = 'http2'
+
+    def __init__(self, max_streams=config.HTTP2_MAX_STREAMS,
+                 host_domain=config.HOST_DOMAIN):
+        """
+        @param max_streams: Maximum number of requests in flight at once.
+            Only used for a host other than the live site.
+        @param host_domain: Host the URIs are on. HTTP/2 is used without
+            negotiating if this is an http host.
+
+        @throws: ImportError if httpx or h2 is not installed.
+        """
+        if httpx is None:
+            raise ImportError("The http2 transport needs httpx and h2. Install"
+                              " with: pip install httpx[http2]")
+        if host_domain == config.DEFAULT_HOST_DOMAIN:
+            # Put no more load on the live site than the session transport.
+            self.max_streams = 1
+            self.spacing = config.REQUEST_SPACING
+        else:
+            self.max_streams = max_streams
+            self.spacing = 0.0
+        self.reset_stats()
+
+        prior_knowledge = urllib.parse.urlsplit(host_domain).scheme == 'http'
+        self.loop = asyncio.new_event_loop()
+        self.client = httpx.AsyncClient(
+            http1=not prior_knowledge,
+            http2=True,
+            timeout=config.REQUEST_TIMEOUT,
+            headers=config.REQUEST_HEADERS,
+            limits=httpx.Limits(max_connections=1)
+        )
+
+    def reset_stats(self):
+        """Start counting requests and new connections from now."""
+        self.requests = 0
+        self.connections = 0
+        self.http_versions = collections.Counter()
+
+    async def _trace(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections += 1
+
+    async def _fetch(self, uri, semaphore):
+        for attempt in range(config.REQUEST_ATTEMPTS):
+            request_start = time.time()
+            try:
+                async with semaphore:
+                    resp = await self.client.get(
+                        uri,
+                        extensions={'trace': self._trace}
+                    )
+                    duration = time.time() - request_start
+                    if resp.status_code == 200 and self.spacing:
+                        # Hold the stream while waiting, so that the spacing
+                        # is kept between requests.
+                        await asyncio.sleep(self.spacing)
+                break
+            except httpx.HTTPError as e:
+                print("Failed attempt #{} {}".format(attempt+1, uri))
+                if attempt + 1 == config.REQUEST_ATTEMPTS:
+                    return FetchResult(uri, None, None, None, None,
+                                       time.time() - request_start, attempt,
+                                       None, e)
+                wait = config.REQUEST_ATTEMPT_WAIT
+                print("  sleeping {}s".format(wait))
+                await asyncio.sleep(wait)
+
+        self.requests += 1
+        self.http_versions[resp.http_version] += 1
+
+        return FetchResult(uri, resp.status_code, resp.reason_phrase,
+                           resp.text, resp.content, duration, attempt,
+                           resp.http_version, None)
+
+    def fetch_many(self, uris):
+        """Fetch URIs concurrently over the connection.
+
+        Requests still in flight are cancelled if the generator is closed
+        early, such as when the caller raises a request error.
+
+        @return: Generator of FetchResult objects, each yielded as soon as
+            it is fetched, in the order that they complete.
+        """
+        semaphore = asyncio.Semaphore(self.max_streams)
+        pending = {self.loop.create_task(self._fetch(uri, semaphore))
+                   for uri in uris}
+        try:
+            while pending:
+                done, pending = self.loop.run_until_complete(asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED
+                ))
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True)
+                )
+
+    def get_stats(self):
+        """Return dict of counts of requests and connections."""
+        return {
+            'transport': self.name,
+            'requests': self.requests,
+            'connections': self.connections,
+            'http_versions': dict(self.http_versions),
+        }
+
+    def close(self):
+        """Close the connection and the event loop."""
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
+
+
+def get_transport(name=config.TRANSPORT, session=None):
+    """Return a transport by name.
+
+    @param name: One of TRANSPORT_NAMES.
+    @param session: Optional requests.Session for the session transport,
+        and for the fallback to it.
+
+    @throws: ValueError if the name is not known.
+    """
+    if name == 'http2':
+        try:
+            return Http2Transport()
+        except ImportError as e:
+            print("{} Falling back to the session transport.".format(e))
+            return SessionTransport(session)
+    if name == 'session':
+        return SessionTransport(session)
+
+    raise ValueError("Unknown transport: {!r}. Expected one of: {}".format(
+        name, ", ".join(TRANSPORT_NAMES)
+    ))